@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+
+"""Compares the load time, resident memory and query latency of the
+ip2asn storage backends.  Each measurement is made in a fresh process,
+first building the backend's store (cold) and then reusing it (warm)."""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic  # noqa: E402
+
+MEASURE = """
+import gc, os, sys, time
+sys.path.insert(0, {root!r})
+sys.path.insert(0, {benchmarks!r})
+
+def rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+import ip2asn
+import synthetic
+addresses = synthetic.random_addresses({count}, {rows})
+
+gc.collect()
+before = rss()
+start = time.perf_counter()
+i2a = ip2asn.IP2ASN({database!r}, backend={backend!r})
+elapsed = time.perf_counter() - start
+
+start = time.perf_counter()
+i2a.lookup_many(addresses)
+lookups = time.perf_counter() - start
+
+gc.collect()
+print(rss() - before, elapsed, lookups / len(addresses))
+"""
+
+
+def measure(database: str, backend: str, count: int, rows: int):
+    """Return (rss bytes, load seconds, seconds per lookup) for a backend."""
+    benchmarks = os.path.dirname(os.path.abspath(__file__))
+    script = MEASURE.format(
+        root=os.path.dirname(benchmarks),
+        benchmarks=benchmarks,
+        database=database,
+        backend=backend,
+        count=count,
+        rows=rows,
+    )
+    (rss, elapsed, latency) = subprocess.check_output(
+        [sys.executable, "-c", script]
+    ).split()
+    return (int(rss), float(elapsed), float(latency))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+    )
+    parser.add_argument("-f", "--ip2asn-database", type=str, help="Database to use instead of a synthetic one")
+    parser.add_argument("-r", "--rows", type=int, default=500000, help="Synthetic database size")
+    parser.add_argument("-n", "--count", type=int, default=100000, help="Number of addresses to look up")
+    parser.add_argument("-b", "--backends", type=str, default="memory,mmap,sqlite", help="Comma separated backends")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = os.path.join(tmpdir, "database.tsv")
+        if args.ip2asn_database:
+            shutil.copy(args.ip2asn_database, database)
+        else:
+            synthetic.write_database(database, args.rows)
+
+        print(f"{'backend':>8} {'load':>5} {'seconds':>9} {'RSS MiB':>9} {'usec/lookup':>12}")
+        for backend in args.backends.split(","):
+            for load in ["cold", "warm"]:
+                (rss, elapsed, latency) = measure(
+                    database, backend, args.count, args.rows
+                )
+                print(
+                    f"{backend:>8} {load:>5} {elapsed:>9.2f} {rss / 2**20:>9.1f} "
+                    f"{latency * 1e6:>12.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+"""Measures the time and peak python memory needed to write the
+msgpack cache, and the time to load the database back from it.
+Each measurement is made in a fresh process."""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic  # noqa: E402
+
+MEASURE = """
+import sys, time, tracemalloc
+sys.path.insert(0, {root!r})
+import ip2asn
+
+i2a = ip2asn.IP2ASN({database!r})
+
+tracemalloc.start()
+start = time.perf_counter()
+i2a.save_msgpack_file()
+save = time.perf_counter() - start
+(_, peak) = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+
+start = time.perf_counter()
+ip2asn.IP2ASN({database!r})
+load = time.perf_counter() - start
+print(save, peak, load)
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+    )
+    parser.add_argument("-f", "--ip2asn-database", type=str, help="Database to use instead of a synthetic one")
+    parser.add_argument("-r", "--rows", type=int, default=500000, help="Synthetic database size")
+    parser.add_argument("-R", "--root", type=str, help="Measure the ip2asn package found in this directory instead")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    root = args.root or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = os.path.join(tmpdir, "database.tsv")
+        if args.ip2asn_database:
+            shutil.copy(args.ip2asn_database, database)
+        else:
+            synthetic.write_database(database, args.rows)
+
+        script = MEASURE.format(root=root, database=database)
+        (save, peak, load) = subprocess.check_output([sys.executable, "-c", script]).split()
+
+        print(f"cache write:   {float(save):8.2f}s")
+        print(f"write peak:    {int(peak) / 2**20:8.1f} MiB (python allocations)")
+        print(f"cache load:    {float(load):8.2f}s")
+        print(f"cache file:    {os.path.getsize(database + '.msgpack') / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
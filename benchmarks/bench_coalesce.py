@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+"""Compares the row count and lookup speed of a raw and a coalesced
+ip2asn table."""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ip2asn  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+    )
+    parser.add_argument("-f", "--ip2asn-database", type=str, help="Database to use instead of a synthetic one")
+    parser.add_argument("-r", "--rows", type=int, default=500000, help="Synthetic database size")
+    parser.add_argument("-n", "--count", type=int, default=500000, help="Number of addresses to look up")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    addresses = synthetic.random_addresses(args.count, args.rows)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = args.ip2asn_database
+        if not database:
+            database = os.path.join(tmpdir, "database.tsv")
+            synthetic.write_database(database, args.rows)
+
+        print(f"{'table':>10} {'rows':>10} {'seconds':>10} {'lookups/s':>12}")
+        for coalesce in [False, True]:
+            i2a = ip2asn.IP2ASN(database, coalesce=coalesce)
+
+            start = time.perf_counter()
+            i2a.lookup_many(addresses)
+            elapsed = time.perf_counter() - start
+
+            print(
+                f"{'coalesced' if coalesce else 'raw':>10} {len(i2a):>10} "
+                f"{elapsed:>10.3f} {args.count / elapsed:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
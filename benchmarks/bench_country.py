@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+
+"""Compares searching for every country's ranges by scanning the whole
+table against using the per-country index, and times the collapsed
+CIDR export."""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ip2asn  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+    )
+    parser.add_argument("-f", "--ip2asn-database", type=str, help="Database to use instead of a synthetic one")
+    parser.add_argument("-r", "--rows", type=int, default=500000, help="Synthetic database size")
+    parser.add_argument("-B", "--backend", default="memory", help="Storage backend to use")
+    return parser.parse_args()
+
+
+def scan_country(i2a, country):
+    """The unindexed search: test the country of every row."""
+    backend = i2a._backend
+    return [
+        row
+        for row in (backend.row(index) for index in range(len(backend)))
+        if row[i2a._country_col] == country
+    ]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = args.ip2asn_database
+        if not database:
+            database = os.path.join(tmpdir, "database.tsv")
+            synthetic.write_database(database, args.rows)
+
+        i2a = ip2asn.IP2ASN(database, backend=args.backend)
+        countries = i2a._backend.countries()
+
+        print(f"{'operation':>24} {'seconds':>10}")
+        if args.backend == "memory":
+            scan = timed(lambda: [scan_country(i2a, cc) for cc in countries])
+            print(f"{'scan all countries':>24} {scan:>10.3f}")
+        indexed = timed(lambda: [i2a.lookup_country(cc) for cc in countries])
+        print(f"{'indexed all countries':>24} {indexed:>10.3f}")
+        print(f"{'cidr export':>24} {timed(i2a.export_country_cidrs):>10.3f}")
+        print(f"{'cidr export (again)':>24} {timed(i2a.export_country_cidrs):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
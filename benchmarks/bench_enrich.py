@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+
+"""Measures the throughput of IP2ASN.enrich() and enrich_async() on an
+in-memory stream of rows."""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ip2asn  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+    )
+    parser.add_argument("-f", "--ip2asn-database", type=str, help="Database to use instead of a synthetic one")
+    parser.add_argument("-r", "--rows", type=int, default=500000, help="Synthetic database size")
+    parser.add_argument("-n", "--count", type=int, default=500000, help="Number of rows to enrich")
+    parser.add_argument("-b", "--batch-sizes", type=str, default="1,100,1000,10000", help="Comma separated batch sizes")
+    return parser.parse_args()
+
+
+async def consume_async(i2a, rows, batch_size):
+    async for _ in i2a.enrich_async(rows, 1, batch_size=batch_size):
+        pass
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = args.ip2asn_database
+        if not database:
+            database = os.path.join(tmpdir, "database.tsv")
+            synthetic.write_database(database, args.rows)
+        i2a = ip2asn.IP2ASN(database)
+
+    addresses = synthetic.random_addresses(args.count, args.rows)
+
+    print(f"{'batch':>8} {'mode':>6} {'seconds':>10} {'rows/s':>12}")
+    for batch_size in [int(x) for x in args.batch_sizes.split(",")]:
+        for mode in ["sync", "async"]:
+            rows = ([str(n), address] for (n, address) in enumerate(addresses))
+            start = time.perf_counter()
+            if mode == "sync":
+                for _ in i2a.enrich(rows, 1, batch_size=batch_size):
+                    pass
+            else:
+                asyncio.run(consume_async(i2a, rows, batch_size))
+            elapsed = time.perf_counter() - start
+            print(f"{batch_size:>8} {mode:>6} {elapsed:>10.3f} {args.count / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+
+"""Loads an ip2asn database once, forks worker processes that run
+lookups against it (like a preforking web server would) and reports
+how much of each worker's memory stayed shared with the parent
+(USS/PSS, from /proc/<pid>/smaps_rollup) along with their lookup
+throughput.  Results are appended as a JSON line so runs can be
+compared across releases."""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+# imported in main() from --root
+ip2asn = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+    )
+    parser.add_argument("-f", "--ip2asn-database", type=str, help="Database to use instead of a synthetic one")
+    parser.add_argument("-r", "--rows", type=int, default=500000, help="Synthetic database size")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of worker processes to fork")
+    parser.add_argument("-n", "--count", type=int, default=200000, help="Number of addresses each worker looks up")
+    parser.add_argument("-B", "--backend", default="memory", choices=["memory", "mmap", "sqlite"], help="Storage backend to load the table into")
+    parser.add_argument("-M", "--coalesce", action="store_true", help="Coalesce adjacent identical ranges")
+    parser.add_argument("-z", "--freeze", action="store_true", help="Call gc.freeze() after loading so the collector leaves the table's objects alone in the workers")
+    parser.add_argument("-o", "--output-file", default="-", type=str, help="Append the JSON result line to this file")
+    parser.add_argument("-R", "--root", type=str, help="Measure the ip2asn package found in this directory (eg, an older release) instead")
+    parser.add_argument("-l", "--label", default="", type=str, help="A free-form label stored with the results")
+    return parser.parse_args()
+
+
+def memory_usage(pid="self") -> dict:
+    """Return the rss, pss and uss (private) sizes of a process in KiB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as rollup:
+        for line in rollup:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def git_revision(root: str):
+    try:
+        return subprocess.check_output(
+            ["git", "-C", root, "describe", "--always", "--dirty"],
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def worker(i2a, number: int, args, ready_fd: int, go_fd: int, result_fd: int):
+    """Run lookups in a forked child and write its results to result_fd."""
+    # generated before measuring so that only the lookups are counted
+    addresses = synthetic.random_addresses(args.count, args.rows, seed=number)
+    before = memory_usage()
+
+    # wait for every worker to be ready so they run concurrently
+    os.write(ready_fd, b"r")
+    os.read(go_fd, 1)
+
+    start = time.perf_counter()
+    if hasattr(i2a, "lookup_many"):
+        for offset in range(0, len(addresses), 1000):
+            i2a.lookup_many(addresses[offset : offset + 1000])
+    else:
+        for address in addresses:
+            i2a.lookup_address(address)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    after = memory_usage()
+    result = {
+        "worker": number,
+        "seconds": round(elapsed, 4),
+        "lookups_per_second": round(args.count / elapsed),
+        "before": before,
+        "after": after,
+        "dirtied": after["uss"] - before["uss"],
+    }
+    os.write(result_fd, (json.dumps(result) + "\n").encode())
+
+
+def run(database: str, args, root: str) -> dict:
+    # only pass options that are in use so older releases can be measured
+    kwargs = {}
+    if args.backend != "memory":
+        kwargs["backend"] = args.backend
+    if args.coalesce:
+        kwargs["coalesce"] = True
+    i2a = ip2asn.IP2ASN(database, **kwargs)
+    gc.collect()
+    if args.freeze:
+        gc.freeze()
+    parent = memory_usage()
+
+    (ready_read, ready_write) = os.pipe()
+    (go_read, go_write) = os.pipe()
+    (result_read, result_write) = os.pipe()
+
+    children = []
+    for number in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                worker(i2a, number, args, ready_write, go_read, result_write)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        children.append(pid)
+
+    for _ in children:
+        os.read(ready_read, 1)
+    os.write(go_write, b"g" * len(children))
+
+    # drain the results before reaping so that a full pipe can't leave
+    # the workers blocked in write() while we wait for them to exit;
+    # EOF arrives once every worker has exited and closed its copy
+    os.close(result_write)
+    with os.fdopen(result_read) as results:
+        lines = results.readlines()
+
+    for pid in children:
+        (_, status) = os.waitpid(pid, 0)
+        if status != 0:
+            raise RuntimeError(f"worker {pid} failed")
+
+    workers = sorted((json.loads(line) for line in lines), key=lambda x: x["worker"])
+
+    return {
+        "benchmark": "fork",
+        "label": args.label,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "ip2asn": ip2asn.__VERSION__,
+        "revision": git_revision(root),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "coalesce": args.coalesce,
+        "freeze": args.freeze,
+        "rows": len(i2a) if hasattr(i2a, "__len__") else len(i2a._data),
+        "count": args.count,
+        "parent": parent,
+        "workers": workers,
+        "summary": {
+            "lookups_per_second": sum(w["lookups_per_second"] for w in workers),
+            "mean_uss": round(sum(w["after"]["uss"] for w in workers) / len(workers)),
+            "mean_dirtied": round(sum(w["dirtied"] for w in workers) / len(workers)),
+            "total_pss": parent["pss"] + sum(w["after"]["pss"] for w in workers),
+        },
+    }
+
+
+def main():
+    global ip2asn
+    args = parse_args()
+
+    root = args.root or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, root)
+    import ip2asn
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = args.ip2asn_database
+        if not database:
+            database = os.path.join(tmpdir, "database.tsv")
+            synthetic.write_database(database, args.rows)
+
+        result = run(database, args, root)
+
+    parent = result["parent"]
+    sys.stderr.write(
+        f"parent: {parent['rss'] / 1024:8.1f} MiB RSS {parent['pss'] / 1024:8.1f} MiB PSS\n"
+    )
+    sys.stderr.write(
+        f"{'worker':>6} {'uss MiB':>9} {'pss MiB':>9} {'dirtied MiB':>12} {'lookups/s':>10}\n"
+    )
+    for w in result["workers"]:
+        sys.stderr.write(
+            f"{w['worker']:>6} {w['after']['uss'] / 1024:>9.1f} {w['after']['pss'] / 1024:>9.1f} "
+            f"{w['dirtied'] / 1024:>12.1f} {w['lookups_per_second']:>10}\n"
+        )
+
+    line = json.dumps(result, sort_keys=True) + "\n"
+    if args.output_file == "-":
+        sys.stdout.write(line)
+    else:
+        with open(args.output_file, "a") as out:
+            out.write(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+"""Reports the resident memory and msgpack cache size of a loaded
+ip2asn database.  Each measurement is made in a fresh process."""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic  # noqa: E402
+
+MEASURE = """
+import gc, os, sys, time
+sys.path.insert(0, {root!r})
+
+def rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+import ip2asn
+gc.collect()
+before = rss()
+start = time.perf_counter()
+i2a = ip2asn.IP2ASN({database!r}, **{kwargs!r})
+elapsed = time.perf_counter() - start
+gc.collect()
+print(rss() - before, elapsed)
+"""
+
+
+def measure(database: str, **kwargs):
+    """Load database in a new interpreter and return (rss bytes, seconds)."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output(
+        [sys.executable, "-c", MEASURE.format(root=root, database=database, kwargs=kwargs)]
+    )
+    (rss, elapsed) = output.split()
+    return (int(rss), float(elapsed))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+    )
+    parser.add_argument("-f", "--ip2asn-database", type=str, help="Database to use instead of a synthetic one")
+    parser.add_argument("-r", "--rows", type=int, default=500000, help="Synthetic database size")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = os.path.join(tmpdir, "database.tsv")
+        if args.ip2asn_database:
+            shutil.copy(args.ip2asn_database, database)
+        else:
+            synthetic.write_database(database, args.rows)
+        cache = database + ".msgpack"
+
+        (rss, elapsed) = measure(database, cache_contents=True)
+        print(f"tsv load:      {rss / 2**20:8.1f} MiB RSS  {elapsed:6.2f}s")
+
+        (rss, elapsed) = measure(database)
+        print(f"msgpack load:  {rss / 2**20:8.1f} MiB RSS  {elapsed:6.2f}s")
+        print(f"msgpack file:  {os.path.getsize(cache) / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+"""Measures throughput of the ip2asn --stream mode on a synthetic
+multi-million line address stream."""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ip2asn  # noqa: E402
+from ip2asn.main import process_stream  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+    )
+    parser.add_argument("-f", "--ip2asn-database", type=str, help="Database to use instead of a synthetic one")
+    parser.add_argument("-r", "--rows", type=int, default=500000, help="Synthetic database size")
+    parser.add_argument("-n", "--count", type=int, default=2000000, help="Number of lines in the stream")
+    parser.add_argument("-b", "--batch-sizes", type=str, default="1,100,10000", help="Comma separated batch sizes")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = args.ip2asn_database
+        if not database:
+            database = os.path.join(tmpdir, "database.tsv")
+            synthetic.write_database(database, args.rows)
+        i2a = ip2asn.IP2ASN(database)
+
+    stream = "\n".join(synthetic.random_addresses(args.count, args.rows)) + "\n"
+
+    print(f"{'batch':>8} {'format':>7} {'seconds':>10} {'lines/s':>12}")
+    for batch_size in [int(x) for x in args.batch_sizes.split(",")]:
+        for output_fsdb in [True, False]:
+            # pyfsdb closes its output handle when done, so use a new one
+            with open(os.devnull, "w") as devnull:
+                start = time.perf_counter()
+                process_stream(
+                    i2a,
+                    io.StringIO(stream),
+                    devnull,
+                    output_fsdb=output_fsdb,
+                    batch_size=batch_size,
+                )
+                elapsed = time.perf_counter() - start
+            print(
+                f"{batch_size:>8} {'fsdb' if output_fsdb else 'text':>7} "
+                f"{elapsed:>10.3f} {args.count / elapsed:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+"""Measures lookup throughput of IP2ASN.lookup_many_threaded against
+the number of worker threads."""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ip2asn  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description=__doc__,
+    )
+    parser.add_argument("-f", "--ip2asn-database", type=str, help="Database to use instead of a synthetic one")
+    parser.add_argument("-r", "--rows", type=int, default=500000, help="Synthetic database size")
+    parser.add_argument("-n", "--count", type=int, default=500000, help="Number of addresses to look up")
+    parser.add_argument("-t", "--threads", type=str, default="1,2,4,8", help="Comma separated thread counts")
+    parser.add_argument("-c", "--chunk-size", type=int, default=10000, help="Addresses per thread work unit")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = args.ip2asn_database
+        if not database:
+            database = os.path.join(tmpdir, "database.tsv")
+            synthetic.write_database(database, args.rows)
+        i2a = ip2asn.IP2ASN(database)
+
+    addresses = synthetic.random_addresses(args.count, args.rows)
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"python {sys.version.split()[0]}, GIL enabled: {gil}")
+    print(f"{'threads':>8} {'seconds':>10} {'lookups/s':>12}")
+
+    for threads in [int(x) for x in args.threads.split(",")]:
+        start = time.perf_counter()
+        i2a.lookup_many_threaded(
+            addresses, max_workers=threads, chunk_size=args.chunk_size
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{threads:>8} {elapsed:>10.3f} {args.count / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Generates synthetic ip2asn-style databases and address streams for
+the benchmark scripts in this directory."""
+
+import random
+
+OWNERS = [
+    "CLOUDFLARENET - Cloudflare, Inc.",
+    "GOOGLE - Google LLC",
+    "AMAZON-02 - Amazon.com, Inc.",
+    "TOT-NET TOT Public Company Limited",
+    "CHINANET-BACKBONE No.31,Jin-rong Street",
+    "WIDE-BB WIDE Project",
+]
+COUNTRIES = ["US", "AU", "JP", "TH", "CN", "DE", "BR", "NL"]
+
+
+def write_database(
+    path, rows: int = 500000, seed: int = 42, split: float = 0.2
+) -> None:
+    """Write a numeric (u32) ip2asn TSV file with `rows` ranges,
+    roughly a third of which are unrouted gaps.  A `split` fraction of
+    the routed ranges continue with the same ASN in the next row, like
+    the real dumps do."""
+    rng = random.Random(seed)
+    start = 16777216
+    asn = None
+    with open(path, "w") as out:
+        for _ in range(rows):
+            end = start + rng.randint(1, 4096)
+            if asn is None and rng.random() < 0.33:
+                out.write(f"{start}\t{end}\t0\tNone\tNot routed\n")
+            else:
+                if asn is None:
+                    asn = rng.randint(1, 5000)
+                out.write(
+                    "{}\t{}\t{}\t{}\t{} {}\n".format(
+                        start,
+                        end,
+                        asn,
+                        COUNTRIES[asn % len(COUNTRIES)],
+                        OWNERS[asn % len(OWNERS)],
+                        asn,
+                    )
+                )
+                if rng.random() >= split:
+                    asn = None
+            start = end + 1
+
+
+def random_addresses(count: int, rows: int = 500000, seed: int = 7) -> list:
+    """Return `count` dotted-quad addresses, mostly covered by the
+    synthetic database of `rows` rows."""
+    rng = random.Random(seed)
+    top = 16777216 + rows * 2048
+    return [
+        "{}.{}.{}.{}".format(n >> 24, (n >> 16) & 0xFF, (n >> 8) & 0xFF, n & 0xFF)
+        for n in (rng.randint(16777216, top) for _ in range(count))
+    ]
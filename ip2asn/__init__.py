@@ -20,31 +20,100 @@ Usage:
 """
 
 import os
+import sys
 import pyfsdb
 import ipaddress
 import msgpack
 import io
+import asyncio
+import heapq
+import hashlib
+import socket
+import threading
+from array import array
 from pathlib import Path
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 
-__VERSION__ = "1.6.6"
+__VERSION__ = "1.7.0"
+
+# bump when the layout of the msgpack cache changes; caches written
+# before the format was recorded (by 1.6.6 and earlier) are format 1
+CACHE_FORMAT = 2
 
 from typing import List
-from logging import error, warning
-from bisect import bisect
+from logging import error, warning, info
+from operator import itemgetter
+
+from ip2asn.backends import BACKENDS, MemoryBackend, write_atomically
 
 DEFAULT_IP2ASN_FILE = Path(os.environ["HOME"]).joinpath(".local/share/ip2asn/database.tsv")
 
 class IP2ASN:
-    """A container for accessing data within an ip2asn file"""
-
-    def __init__(self, ip2asn_file = DEFAULT_IP2ASN_FILE, ipversion=None, cache_contents: bool = False):
-
-        self._file = ip2asn_file
+    """A container for accessing data within an ip2asn file.
+
+    Lookups are thread-safe: the loaded table is published as a single
+    immutable backend, so any number of threads may call the
+    `lookup_*` methods while another thread calls `read_data()` to
+    reload it."""
+
+    def __init__(
+        self,
+        ip2asn_file=DEFAULT_IP2ASN_FILE,
+        ipversion=None,
+        cache_contents: bool = False,
+        coalesce: bool = False,
+        backend: str = "memory",
+    ):
+        """Load an ip2asn database.  When `coalesce` is set, adjacent
+        rows with identical ASN, country and owner values are merged
+        into a single (smaller and faster to search) range; leave it
+        off to keep the exact row boundaries of the source file.
+
+        `backend` selects where the table is stored (see
+        ip2asn.backends): "memory", "mmap" or "sqlite".  The mmap and
+        sqlite backends keep their store next to the database file.
+
+        `ip2asn_file` may also be a list of databases to merge, such
+        as a public ip2asn dump followed by local overrides.  Later
+        entries take precedence over earlier ones, unless entries are
+        given as (database, priority) pairs, in which case the highest
+        priority wins.  Overlapping ranges are split so the merged
+        table never overlaps."""
+
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown ip2asn backend '{backend}'")
+
+        if not isinstance(ip2asn_file, list):
+            ip2asn_file = [ip2asn_file]
+
+        # sort by (priority, position), lowest first
+        sources = []
+        for (position, source) in enumerate(ip2asn_file):
+            priority = position
+            if isinstance(source, tuple):
+                (source, priority) = source
+            sources.append((priority, position, source))
+        self._sources = [source for (_, _, source) in sorted(sources)]
+
+        self._file = self._sources[0]
         self._version = ipversion
+        self._coalesce = coalesce
+        self._backend_name = backend
 
         self._msgpack_extension = ".msgpack"
 
+        (
+            self._start_col,
+            self._end_col,
+            self._asn_col,
+            self._country_col,
+            self._name_col,
+        ) = range(5)
+
+        # replaced as a whole on (re)load, never modified in place
+        self._backend = MemoryBackend()
+        self._lock = threading.RLock()
+
         # TODO(hardaker): this probably shouldn't be forced called in init()
         self.read_data(cache_contents)
 
@@ -57,10 +126,37 @@ class IP2ASN:
         else:
             return self._file.name
 
+    @property
+    def source_files(self) -> List[str]:
+        """The names of the databases (that are files) being loaded."""
+        return [
+            str(source) for source in self._sources if isinstance(source, (str, Path))
+        ]
+
+    def store_name(self, extension: str):
+        """Return the name of a cache file stored next to the database,
+        or None if the database isn't a file.  Merged databases get a
+        name unique to the list of sources merged into it."""
+        if len(self.source_files) != len(self._sources):
+            return None
+
+        name = str(self._file)
+        if len(self._sources) > 1:
+            digest = hashlib.sha1(repr(self.source_files).encode()).hexdigest()
+            name += ".merged-" + digest[:10]
+        return name + extension
+
+    def __len__(self) -> int:
+        return len(self._backend)
+
     def read_data(self, cache_contents: bool = False):
-        self.read_data_internal()
-        if cache_contents:
-            self.save_msgpack_file()
+        # serialize (re)loads; lookups keep using the previous backend
+        # until the new one is swapped in
+        with self._lock:
+            self._cache_contents = cache_contents
+            self.read_data_internal(cache_contents)
+            if cache_contents:
+                self.save_msgpack_file()
 
     def save_large_numbers32(self, dataset: List[int]) -> List[int | List[int]]:
         transformmed = []
@@ -116,18 +212,16 @@ class IP2ASN:
         return transformmed
 
     def save_data_numbers64(self, dataset: List[int]) -> List[int | List[int]]:
-        transformmed = deepcopy(dataset)
-        for item in transformmed:
-            if item[0] >= 2**64:
-                item[0] = [
-                    (item[0] & 0xFFFFFFFFFFFFFFFF0000000000000000) >> 8 * 8,
-                    (item[0] & 0xFFFFFFFFFFFFFFFF),
-                ]
-            if item[1] >= 2**64:
-                item[1] = [
-                    (item[1] & 0xFFFFFFFFFFFFFFFF0000000000000000) >> 8 * 8,
-                    (item[1] & 0xFFFFFFFFFFFFFFFF),
-                ]
+        """Return a copy of a list of rows with their 128 bit start and
+        end values encoded as pairs of 64 bit integers."""
+        transformmed = []
+        for item in dataset:
+            (start, end) = (item[0], item[1])
+            if start >= 2**64:
+                start = [start >> 8 * 8, start & 0xFFFFFFFFFFFFFFFF]
+            if end >= 2**64:
+                end = [end >> 8 * 8, end & 0xFFFFFFFFFFFFFFFF]
+            transformmed.append([start, end, *item[2:]])
         return transformmed
 
     def load_data_numbers64(self, dataset: List[int | List[int]]) -> List[int]:
@@ -141,58 +235,217 @@ class IP2ASN:
             transformmed.append(item)
         return transformmed
 
-    def read_msgpack_file(self) -> bool:
-        """Read a msgpack compressed version of the database if available."""
-        msgpack_filename = self.file_name + self._msgpack_extension
+    def read_msgpack_file(self, msgpack_filename: str = None, sources: list = None):
+        """Read a msgpack compressed version of the database if
+        available, returning it as a MemoryBackend table.  The cache is
+        ignored when any of the `sources` it was made from is newer."""
+        if msgpack_filename is None:
+            msgpack_filename = self.file_name + self._msgpack_extension
+            sources = [self.file_name]
         if not os.path.exists(msgpack_filename):
-            return False
+            return None
+
+        modified = os.path.getmtime(msgpack_filename)
+        for source in sources or []:
+            if os.path.exists(source) and os.path.getmtime(source) > modified:
+                info(f"ignoring the outdated ip2asn cache file {msgpack_filename}")
+                return None
+
+        # a damaged cache is reread from the original, like an old one
+        try:
+            with open(msgpack_filename, "rb") as cache:
+                contents = msgpack.load(cache)
+
+            cache_format = contents.get("format", 1)
+            if cache_format > CACHE_FORMAT:
+                warning(
+                    f"ignoring the ip2asn cache file {msgpack_filename} written in a newer format ({cache_format}) by version {contents.get('version')}"
+                )
+                return None
 
-        contents = msgpack.load(open(msgpack_filename, "rb"))
+            if contents.get("coalesced") and not self._coalesce:
+                # the original row boundaries can't be recovered from here
+                info("ignoring the coalesced ip2asn cache file")
+                return None
 
-        if contents["version"] != __VERSION__:
-            warning(
-                f"This ip2asn cache file was created with an older version ({contents['version']}) -- things may break."
+            if "columns" in contents:
+                table = self.load_msgpack_columns(contents)
+            else:
+                table = self.load_msgpack_rows(contents)
+        except (
+            AttributeError,
+            IndexError,
+            KeyError,
+            TypeError,
+            ValueError,
+            msgpack.UnpackException,
+        ) as exception:
+            warning(f"ignoring the damaged ip2asn cache file {msgpack_filename}: {exception!r}")
+            return None
+
+        if self._coalesce and not contents.get("coalesced"):
+            (data, strings) = table.to_rows()
+            table = MemoryBackend.from_rows(
+                self.coalesce_rows(data), strings, coalesce=True
             )
 
-        self._data = self.load_data_numbers64(contents["data"])
-        self._left_keys = self.load_large_numbers64(contents["left_keys"])
+        return table
+
+    def load_msgpack_columns(self, contents: dict) -> MemoryBackend:
+        """Turn the packed column blobs of a msgpack cache into arrays."""
+        columns = {}
+        for (name, typecode) in MemoryBackend.COLUMNS + MemoryBackend.INDEX_COLUMNS:
+            packed = contents["columns"].get(name)
+            if packed is None:
+                # missing indexes get recreated
+                continue
+            column = array(typecode)
+            if column.itemsize != packed["itemsize"]:
+                raise ValueError(f"unsupported {name} column size in the ip2asn cache")
+            column.frombytes(packed["data"])
+            if packed["byteorder"] != sys.byteorder:
+                column.byteswap()
+            columns[name] = column
+
+        table = MemoryBackend(coalesce=contents["coalesced"])
+        table.set_columns(columns, contents["strings"])
+        return table
+
+    def load_msgpack_rows(self, contents: dict) -> MemoryBackend:
+        """Read the per-row layout used by older msgpack caches."""
         self._start_col = contents["start_col"]
         self._end_col = contents["end_col"]
         self._asn_col = contents["asn_col"]
         self._country_col = contents["country_col"]
         self._name_col = contents["name_col"]
 
-        return True
+        data = self.load_data_numbers64(contents["data"])
+        if "strings" in contents:
+            strings = contents["strings"]
+        else:
+            # older caches stored every string in every unsorted row
+            strings = self.pool_strings(data)
+            data.sort(key=itemgetter(self._start_col))
+
+        return MemoryBackend.from_rows(
+            data, strings, coalesce=contents.get("coalesced", False)
+        )
 
     def save_msgpack_file(self) -> None:
         """Save the stored data into a msgpack file."""
 
-        msgpack_filename = self.file_name + self._msgpack_extension
-
-        contents = {
+        if len(self._sources) == 1:
+            msgpack_filename = self.file_name + self._msgpack_extension
+        else:
+            msgpack_filename = self.store_name(self._msgpack_extension)
+            if not msgpack_filename:
+                return
+
+        self.write_msgpack_file(msgpack_filename, self._backend.to_table())
+
+    def write_msgpack_file(self, msgpack_filename: str, table: MemoryBackend) -> None:
+        """Write a table into a msgpack file.  Each column is stored as
+        a single bin blob holding its raw array, streamed straight from
+        memory into the file."""
+        packer = msgpack.Packer()
+        header = {
             "version": __VERSION__,
-            "data": self.save_data_numbers64(self._data),
-            "left_keys": self.save_large_numbers64(self._left_keys),
-            "start_col": self._start_col,
-            "end_col": self._end_col,
-            "asn_col": self._asn_col,
-            "country_col": self._country_col,
-            "name_col": self._name_col,
+            "format": CACHE_FORMAT,
+            "coalesced": self._coalesce,
+            "rows": len(table),
+            "strings": table.strings,
         }
-        msgpack.pack(contents, open(msgpack_filename, "wb"))
-
-    def read_data_internal(self) -> None:
-        """Read data from the ip2asn file."""
 
-        if self.read_msgpack_file():
-            return
-
-        if isinstance(self._file, str):
+        def write(filename):
+            with open(filename, "wb") as cache:
+                cache.write(packer.pack_map_header(len(header) + 1))
+                for (key, value) in header.items():
+                    cache.write(packer.pack(key))
+                    cache.write(packer.pack(value))
+
+                cache.write(packer.pack("columns"))
+                cache.write(packer.pack_map_header(len(table.columns)))
+                for (name, column) in table.columns.items():
+                    cache.write(packer.pack(name))
+                    cache.write(packer.pack_map_header(3))
+                    cache.write(packer.pack("itemsize"))
+                    cache.write(packer.pack(column.itemsize))
+                    cache.write(packer.pack("byteorder"))
+                    cache.write(packer.pack(sys.byteorder))
+                    cache.write(packer.pack("data"))
+                    # a msgpack bin 32 header, followed by the raw array
+                    cache.write(b"\xc6" + (column.itemsize * len(column)).to_bytes(4, "big"))
+                    cache.write(column)
+
+        # the cache is only an optimization, so failing to write it
+        # (eg, in a read only directory) isn't fatal
+        try:
+            write_atomically(msgpack_filename, write)
+        except OSError as exception:
+            warning(f"unable to write the ip2asn cache file {msgpack_filename}: {exception}")
+
+    def read_data_internal(self, cache_contents: bool = False) -> None:
+        """Read data from the ip2asn file(s) (or their caches) into a
+        new backend."""
+
+        backend_class = BACKENDS[self._backend_name]
+        backend = backend_class(
+            path=self.store_name(backend_class.extension or ""),
+            sources=self.source_files,
+            coalesce=self._coalesce,
+        )
+
+        if not backend.open():
+            backend.build(self.read_sources(cache_contents))
+
+        self._backend = backend
+
+    def read_sources(self, cache_contents: bool = False) -> MemoryBackend:
+        """Read and merge all of the databases, returning the result
+        as a MemoryBackend table."""
+
+        if len(self._sources) == 1:
+            return self.read_msgpack_file() or self.read_tsv_file()
+
+        merged_cache = self.store_name(self._msgpack_extension)
+        if merged_cache:
+            table = self.read_msgpack_file(merged_cache, self.source_files)
+            if table:
+                return table
+
+        # each database has its own cache, so that editing a small
+        # override file doesn't require re-parsing a large public dump
+        layers = []
+        for source in self._sources:
+            cache = None
+            if isinstance(source, (str, Path)):
+                cache = str(source) + self._msgpack_extension
+            table = cache and self.read_msgpack_file(cache, [str(source)])
+            if not table:
+                table = self.read_tsv_file(source)
+                if cache and cache_contents:
+                    self.write_msgpack_file(cache, table)
+            layers.append(table.to_rows())
+
+        (data, strings) = self.merge_layers(layers)
+        if self._coalesce:
+            data = self.coalesce_rows(data)
+        return MemoryBackend.from_rows(data, strings, coalesce=self._coalesce)
+
+    def read_tsv_file(self, source=None):
+        """Read and parse an ip2asn tsv file, returning it as a
+        MemoryBackend table."""
+
+        if source is None:
+            source = self._file
+
+        if isinstance(source, str):
             # assume a file name
-            iptoasn = pyfsdb.Fsdb(self._file)
+            iptoasn = pyfsdb.Fsdb(source)
         else:
-            # assume it's a file handle instead
-            iptoasn = pyfsdb.Fsdb(file_handle=self._file.open())
+            # assume it's a file handle (or a Path) instead
+            handle = source.open() if hasattr(source, "open") else source
+            iptoasn = pyfsdb.Fsdb(file_handle=handle)
 
         # set the column names for pyfsdb
         iptoasn.column_names = ["start", "end", "ASN", "country", "name"]
@@ -206,8 +459,7 @@ class IP2ASN:
         ) = iptoasn.get_column_numbers(iptoasn.column_names)
 
         # XXX: fsdb should do this for us
-        self._data = []
-        self._left_keys = []
+        data = []
         for row in iptoasn:
             try:
                 row[self._start_col] = int(row[self._start_col])
@@ -221,8 +473,138 @@ class IP2ASN:
                     error(f"failed to parse {row}")
                     continue
 
-            self._data.append(row)
-            self._left_keys.append(int(row[self._start_col]))
+            data.append(row)
+
+        # the combined dumps list the v6 ranges after the v4 ones
+        data.sort(key=itemgetter(self._start_col))
+
+        strings = self.pool_strings(data)
+        if self._coalesce:
+            data = self.coalesce_rows(data)
+        return MemoryBackend.from_rows(data, strings, coalesce=self._coalesce)
+
+    def pool_strings(self, data: list) -> List[str]:
+        """Replace the ASN, country and name strings within the data
+        rows by indexes into a deduplicated pool, which is returned."""
+        strings = []
+        refs = {}
+        columns = [self._asn_col, self._country_col, self._name_col]
+        for row in data:
+            for column in columns:
+                value = row[column]
+                ref = refs.get(value)
+                if ref is None:
+                    ref = refs[value] = len(strings)
+                    strings.append(value)
+                row[column] = ref
+        return strings
+
+    def merge_layers(self, layers: list):
+        """Merge a list of (rows, strings) tables, lowest priority
+        first, into a single table where the ranges of each layer
+        replace any parts of the earlier layers they overlap."""
+        strings = []
+        refs = {}
+        merged = []
+        for (data, layer_strings) in layers:
+            # move everything into a single string pool
+            remap = []
+            for value in layer_strings:
+                ref = refs.get(value)
+                if ref is None:
+                    ref = refs[value] = len(strings)
+                    strings.append(value)
+                remap.append(ref)
+            data = [
+                [row[0], row[1], remap[row[2]], remap[row[3]], remap[row[4]]]
+                for row in data
+            ]
+            merged = self.overlay_rows(merged, self.flatten_rows(data))
+        return (merged, strings)
+
+    def flatten_rows(self, data: list) -> list:
+        """Return the rows of a single database split so that none of
+        them overlap.  Where a row is nested inside another, the more
+        specific (inner) row wins and the outer one is cut around it;
+        where rows only partially overlap, the later starting one wins."""
+        pieces = []
+        enclosing = []
+        position = None
+        for row in sorted(data, key=lambda row: (row[0], -row[1])):
+            start = row[0]
+
+            # finish the enclosing rows that end before this one starts
+            while enclosing and enclosing[-1][1] < start:
+                outer = enclosing.pop()
+                if position <= outer[1]:
+                    pieces.append([position, outer[1]] + outer[2:])
+                    position = outer[1] + 1
+
+            if enclosing and position < start:
+                outer = enclosing[-1]
+                pieces.append([position, start - 1] + outer[2:])
+
+            position = start
+            enclosing.append(row)
+
+        while enclosing:
+            outer = enclosing.pop()
+            if position <= outer[1]:
+                pieces.append([position, outer[1]] + outer[2:])
+                position = outer[1] + 1
+
+        return pieces
+
+    def overlay_rows(self, base: list, top: list) -> list:
+        """Lay the sorted, non-overlapping `top` rows over the `base`
+        ones, splitting or dropping base rows where they overlap."""
+        if not base:
+            return top
+        if not top:
+            return base
+
+        pieces = []
+        first = 0
+        for row in base:
+            (start, end) = (row[0], row[1])
+
+            # skip the top rows that end before this one starts
+            while first < len(top) and top[first][1] < start:
+                first += 1
+
+            # and cut out the ones that overlap it
+            index = first
+            while index < len(top) and top[index][0] <= end:
+                if top[index][0] > start:
+                    pieces.append([start, top[index][0] - 1] + row[2:])
+                start = top[index][1] + 1
+                if start > end:
+                    break
+                index += 1
+
+            if start <= end:
+                pieces.append([start, end] + row[2:])
+
+        return list(heapq.merge(pieces, top, key=itemgetter(0)))
+
+    def coalesce_rows(self, data: list) -> list:
+        """Return a copy of the (pooled) data rows where contiguous
+        ranges with the same ASN, country and name are merged."""
+        coalesced = []
+        last = None
+        for row in data:
+            if (
+                last is not None
+                and last[self._end_col] + 1 == row[self._start_col]
+                and last[self._asn_col] == row[self._asn_col]
+                and last[self._country_col] == row[self._country_col]
+                and last[self._name_col] == row[self._name_col]
+            ):
+                last[self._end_col] = row[self._end_col]
+                continue
+            last = list(row)
+            coalesced.append(last)
+        return coalesced
 
     def ip2int(self, address, version=None):
         """Converts an ascii represented IPv4 or IPv6 address into an
@@ -240,30 +622,29 @@ class IP2ASN:
                 else:
                     ip = int(ipaddress.IPv6Address(address))
             elif address.find(":") != -1:
-                ip = int(ipaddress.IPv6Address(address))
+                try:
+                    ip = int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+                except (OSError, TypeError):
+                    # let ipaddress handle scope ids or raise a useful error
+                    ip = int(ipaddress.IPv6Address(address))
             else:
-                ip = int(ipaddress.IPv4Address(address))
+                try:
+                    ip = int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+                except (OSError, TypeError):
+                    ip = int(ipaddress.IPv4Address(address))
         return ip
 
     def lookup_address_row(self, address):
         """Look up an ip address from the ip2asn data, and return its row."""
         # get a numeric representation
         ip = self.ip2int(address)
+        return self._backend.find(ip)
 
-        point = bisect(self._left_keys, ip)
-        if point != len(self._left_keys):
-            row = self._data[point - 1]
-            if ip >= row[self._start_col] and ip <= row[self._end_col]:
-                return row
-
-    def lookup_address(self, address):
-        """Look up an ip address (dotted string) and return a
-        dictionary of information about it.
-        (transforming the row returned by lookup_address_row)"""
-        results = self.lookup_address_row(address)
+    def _lookup_address(self, address, backend):
+        ip = self.ip2int(address)
+        results = backend.find(ip)
         if not results:
             return results
-        ip = self.ip2int(address)
         return {
             "ip_text": address,
             "ip_numeric": ip,
@@ -273,28 +654,289 @@ class IP2ASN:
             "owner": results[self._name_col],
         }
 
+    def lookup_address(self, address):
+        """Look up an ip address (dotted string) and return a
+        dictionary of information about it.
+        (transforming the row returned by lookup_address_row)"""
+        return self._lookup_address(address, self._backend)
+
+    def lookup_many(self, addresses, skip_invalid: bool = False) -> list:
+        """Look up a batch of addresses, returning a list of results
+        (or None for unknown addresses) in the same order.  The whole
+        batch is answered from a single snapshot of the table.  With
+        `skip_invalid`, strings that aren't addresses also return None
+        instead of raising a ValueError."""
+        backend = self._backend
+        if not skip_invalid:
+            return [self._lookup_address(address, backend) for address in addresses]
+
+        results = []
+        for address in addresses:
+            try:
+                results.append(self._lookup_address(address, backend))
+            except ValueError:
+                results.append(None)
+        return results
+
+    def lookup_many_threaded(
+        self, addresses, max_workers: int = None, chunk_size: int = 10000
+    ) -> list:
+        """Look up a large batch of addresses by splitting it into
+        `chunk_size` pieces spread across a ThreadPoolExecutor.  Results
+        are returned in input order.  This mostly pays off on
+        free-threaded python builds; with the GIL it behaves much like
+        `lookup_many`."""
+        addresses = list(addresses)
+        if len(addresses) <= chunk_size:
+            return self.lookup_many(addresses)
+
+        # every chunk is answered from the same snapshot of the table
+        backend = self._backend
+
+        def lookup_chunk(chunk):
+            return [self._lookup_address(address, backend) for address in chunk]
+
+        chunks = [
+            addresses[i : i + chunk_size]
+            for i in range(0, len(addresses), chunk_size)
+        ]
+        results = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for chunk_results in executor.map(lookup_chunk, chunks):
+                results.extend(chunk_results)
+        return results
+
     def lookup_asn(self, asn, limit=None):
         """Lookups all the entries in the database containing a
         particular ASN"""
 
         asn = str(asn)  # turn an into back to a string
 
-        results = []
-        for record in self._data:
-            if record[self._asn_col] == asn:
-                results.append(
-                    {
-                        "ip_range": [record[self._start_col], record[self._end_col]],
-                        "ASN": record[self._asn_col],
-                        "country": record[self._country_col],
-                        "owner": record[self._name_col],
-                    }
-                )
-                if limit and len(results) == limit:
-                    return results
+        return self._range_results(self._backend.find_asn(asn, limit))
 
+    def lookup_country(self, country: str, limit=None):
+        """Lookups all the entries in the database for a particular
+        (two letter, case insensitive) country code"""
+        country = self.country_code(country)
+        return self._range_results(self._backend.find_country(country, limit))
+
+    def lookup_country_asns(self, country: str) -> List[str]:
+        """Return the sorted list of ASNs with ranges in a country."""
+        records = self._backend.find_country(self.country_code(country))
+        asns = {record[self._asn_col] for record in records}
+        return sorted(asns, key=lambda asn: int(asn) if asn.isdigit() else -1)
+
+    def country_code(self, country: str) -> str:
+        """Normalize a two letter country code to the upper case form
+        used by the database (other values, like "None", are kept)."""
+        if len(country) == 2:
+            return country.upper()
+        return country
+
+    def _range_results(self, records) -> list:
+        results = []
+        for record in records:
+            results.append(
+                {
+                    "ip_range": [record[self._start_col], record[self._end_col]],
+                    "ASN": record[self._asn_col],
+                    "country": record[self._country_col],
+                    "owner": record[self._name_col],
+                }
+            )
         return results
 
+    def ranges_to_cidrs(self, ranges) -> List[str]:
+        """Convert a list of [start, end] numeric ranges into the
+        smallest list of CIDR prefixes covering them.  Like the rest of
+        ip2asn, ranges below 2**32 are treated as IPv4 ones."""
+        cidrs = []
+        last = None
+        merged = []
+        for (start, end) in sorted(ranges):
+            if last and start <= last[1] + 1:
+                last[1] = max(last[1], end)
+            else:
+                last = [start, end]
+                merged.append(last)
+
+        inet_ntop = socket.inet_ntop
+        for (start, end) in merged:
+            if end < 2**32:
+                (bits, family, width) = (32, socket.AF_INET, 4)
+            else:
+                (bits, family, width) = (128, socket.AF_INET6, 16)
+            while start <= end:
+                # the largest block aligned on start that still fits
+                alignment = (start & -start).bit_length() - 1 if start else bits
+                size = min(alignment, (end - start + 1).bit_length() - 1)
+                address = inet_ntop(family, start.to_bytes(width, "big"))
+                cidrs.append(f"{address}/{bits - size}")
+                start += 1 << size
+        return cidrs
+
+    def export_country_cidrs(self, countries: List[str] = None) -> dict:
+        """Return a dictionary of country codes to the collapsed CIDR
+        prefixes they cover, for all countries or just those listed.
+        Results are remembered until the database is reloaded, and
+        with `cache_contents` they are also kept in a cache file next
+        to the database."""
+        backend = self._backend
+        if countries is None:
+            countries = backend.countries()
+        else:
+            countries = [self.country_code(country) for country in countries]
+
+        cidrs_filename = None
+        if self._cache_contents:
+            cidrs_filename = self.store_name(".cidrs" + self._msgpack_extension)
+
+        with self._lock:
+            known = backend.memo.get("country_cidrs")
+            if known is None:
+                known = backend.memo["country_cidrs"] = {}
+                if cidrs_filename:
+                    known.update(self.read_cidrs_file(cidrs_filename))
+
+        # computed outside the lock, then merged and saved under it
+        added = {}
+        for country in countries:
+            if country not in known and country not in added:
+                ranges = [
+                    [record[self._start_col], record[self._end_col]]
+                    for record in backend.find_country(country)
+                ]
+                added[country] = self.ranges_to_cidrs(ranges)
+
+        if added:
+            with self._lock:
+                known.update(added)
+                if cidrs_filename:
+                    self.write_cidrs_file(cidrs_filename, dict(known))
+
+        return {country: known[country] for country in countries}
+
+    def read_cidrs_file(self, cidrs_filename: str) -> dict:
+        """Read the per-country CIDR lists saved by
+        export_country_cidrs, if they are newer than the databases."""
+        if not os.path.exists(cidrs_filename):
+            return {}
+
+        modified = os.path.getmtime(cidrs_filename)
+        for source in self.source_files:
+            if os.path.exists(source) and os.path.getmtime(source) > modified:
+                info(f"ignoring the outdated ip2asn cidr cache {cidrs_filename}")
+                return {}
+
+        with open(cidrs_filename, "rb") as cache:
+            contents = msgpack.load(cache)
+        if contents.get("version") != __VERSION__:
+            return {}
+        return contents["countries"]
+
+    def write_cidrs_file(self, cidrs_filename: str, countries: dict) -> None:
+        """Save the per-country CIDR lists into a msgpack file."""
+
+        def write(filename):
+            with open(filename, "wb") as cache:
+                msgpack.dump({"version": __VERSION__, "countries": countries}, cache)
+
+        try:
+            write_atomically(cidrs_filename, write)
+        except OSError as exception:
+            warning(f"unable to write the ip2asn cidr cache file {cidrs_filename}: {exception}")
+
+    def _enrich_batch(
+        self, rows: list, key_col: int, by_asn: bool = False, skip_invalid: bool = True
+    ) -> list:
+        """Add the lookup results for a batch of rows to each row."""
+        if by_asn:
+            for row in rows:
+                results = self.lookup_asn(row[key_col], limit=1)
+                if results:
+                    result = results[0]
+                    row.extend([result["owner"], result["country"], result["ip_range"]])
+                else:
+                    row.extend(["-", "-", "-"])
+            return rows
+
+        results = self.lookup_many([row[key_col] for row in rows], skip_invalid)
+        for (row, result) in zip(rows, results):
+            if result:
+                row.extend(
+                    [
+                        result["ip_numeric"],
+                        result["ASN"],
+                        result["owner"],
+                        result["country"],
+                        result["ip_range"],
+                    ]
+                )
+            else:
+                row.extend(["-", "-", "-", "-", "-"])
+        return rows
+
+    def enrich(
+        self,
+        rows,
+        key_col: int,
+        by_asn: bool = False,
+        batch_size: int = 1000,
+        skip_invalid: bool = True,
+    ):
+        """A generator that extends each row (a list) with information
+        about the address (or ASN, with `by_asn`) in its `key_col`
+        column.  Address rows gain ip_numeric, ASN, owner, country and
+        ip_range columns; ASN rows gain owner, country and ip_range.
+        Unknown keys, and keys that aren't addresses, get "-" values;
+        pass `skip_invalid=False` to have the latter raise a ValueError
+        instead.  Rows are pulled from `rows` and looked up
+        `batch_size` at a time."""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield from self._enrich_batch(batch, key_col, by_asn, skip_invalid)
+                batch = []
+        if batch:
+            yield from self._enrich_batch(batch, key_col, by_asn, skip_invalid)
+
+    async def enrich_async(
+        self,
+        rows,
+        key_col: int,
+        by_asn: bool = False,
+        batch_size: int = 1000,
+        skip_invalid: bool = True,
+    ):
+        """An async generator version of `enrich`, accepting either an
+        iterable or an async iterable of rows.  Each batch is looked up
+        in the default executor so the event loop stays responsive."""
+        loop = asyncio.get_running_loop()
+
+        if not hasattr(rows, "__aiter__"):
+            rows = _async_rows(rows)
+
+        batch = []
+        async for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                for row in await loop.run_in_executor(
+                    None, self._enrich_batch, batch, key_col, by_asn, skip_invalid
+                ):
+                    yield row
+                batch = []
+        if batch:
+            for row in await loop.run_in_executor(
+                None, self._enrich_batch, batch, key_col, by_asn, skip_invalid
+            ):
+                yield row
+
+
+async def _async_rows(rows):
+    for row in rows:
+        yield row
+
 
 def testmain():
     import os
@@ -0,0 +1,551 @@
+"""Storage backends that hold the ip2asn range table.
+
+Every backend is built from a table of sorted, non-overlapping ranges
+held in a MemoryBackend (whose columns may also be created from rows
+of [start, end, asn_ref, country_ref, name_ref], where the refs index
+a list of strings) and answers range queries for a numeric address.
+Backends are never modified once built, so a built backend can be
+shared between threads; reloading creates and swaps in a new one.
+
+    memory -- columns of packed arrays held in memory (fastest)
+    mmap   -- the same columns, memory mapped from a file next to the
+              database (smallest RSS, shared between processes)
+    sqlite -- an sqlite database with an index on the range starts
+              (slowest, but can be queried with SQL)
+"""
+
+import os
+import sys
+import mmap
+import sqlite3
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import accumulate
+from pathlib import Path
+from typing import List
+
+import msgpack
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# bump when the on-disk layout of a backend store changes
+STORE_FORMAT = 2
+
+
+def write_atomically(path: str, write) -> None:
+    """Call write(filename) to fill a unique temporary file next to
+    `path`, then move it over `path`.  Processes writing the same file
+    at once each write their own copy and the last one to finish wins;
+    readers only ever see complete files.  The temporary file is
+    removed if anything fails."""
+    (handle, new_path) = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=os.path.basename(path) + ".",
+        suffix=".new",
+    )
+    os.close(handle)
+    try:
+        # mkstemp files are private to us; stores are meant to be shared
+        os.chmod(new_path, 0o644)
+        write(new_path)
+        os.replace(new_path, path)
+    except BaseException:
+        try:
+            os.unlink(new_path)
+        except OSError:
+            pass
+        raise
+
+
+class Backend:
+    """The interface shared by all the ip2asn storage backends."""
+
+    name = None
+    extension = None
+
+    def __init__(self, path: str = None, sources: list = None, coalesce: bool = False):
+        """Create an (empty) backend.  `path` is where a persistent
+        store is kept (if the backend has one), `sources` are the
+        database files it is derived from and `coalesce` records
+        whether its rows were coalesced."""
+        self.path = path
+        self.sources = sources or []
+        self.coalesce = coalesce
+
+        # results derived from the (immutable) table, eg, CIDR lists
+        self.memo = {}
+
+    def is_current(self) -> bool:
+        """Check whether the persistent store exists and is at least as
+        new as all of the source databases."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        modified = os.path.getmtime(self.path)
+        for source in self.sources:
+            if os.path.exists(source) and os.path.getmtime(source) > modified:
+                return False
+        return True
+
+    def open(self) -> bool:
+        """Open an existing, up to date, persistent store."""
+        return False
+
+    def build(self, table: "MemoryBackend") -> None:
+        """Create our contents from a table of sorted ranges."""
+        raise NotImplementedError
+
+    def write_store(self, write) -> None:
+        """Write our persistent store with write(filename).  If another
+        process replaced it first we use theirs, and if it can't be
+        written next to the database at all (a read only directory, for
+        example) a private temporary copy is written instead."""
+        if self.path:
+            try:
+                write_atomically(self.path, write)
+                return
+            except (OSError, sqlite3.Error):
+                if self.open():
+                    # a sibling process finished building the same store
+                    return
+
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmpdir.name, "table" + self.extension)
+        write(self.path)
+
+    def find(self, ip: int):
+        """Return the decoded [start, end, asn, country, name] row
+        containing the numeric ip, or None."""
+        raise NotImplementedError
+
+    def find_asn(self, asn: str, limit: int = None) -> list:
+        """Return the decoded rows for a given ASN."""
+        raise NotImplementedError
+
+    def find_country(self, country: str, limit: int = None) -> list:
+        """Return the decoded rows for a given country code."""
+        raise NotImplementedError
+
+    def countries(self) -> List[str]:
+        """Return the sorted list of country codes in the table."""
+        raise NotImplementedError
+
+    def to_rows(self):
+        """Return the table as (pooled rows, strings)."""
+        raise NotImplementedError
+
+    def to_table(self) -> "MemoryBackend":
+        """Return the table as a (columnar) MemoryBackend."""
+        return MemoryBackend.from_rows(*self.to_rows(), coalesce=self.coalesce)
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryBackend(Backend):
+    """Keeps the table as columns of packed arrays in memory.  128 bit
+    range boundaries are split into high and low 64 bit halves."""
+
+    name = "memory"
+
+    COLUMNS = [
+        ("starts_hi", "Q"),
+        ("starts_lo", "Q"),
+        ("ends_hi", "Q"),
+        ("ends_lo", "Q"),
+        ("asns", "I"),
+        ("countries", "I"),
+        ("names", "I"),
+    ]
+
+    # rows grouped by their asn/country reference, and the offset at
+    # which each reference's group starts within them
+    INDEX_COLUMNS = [
+        ("asn_offsets", "I"),
+        ("asn_rows", "I"),
+        ("country_offsets", "I"),
+        ("country_rows", "I"),
+    ]
+
+    def __init__(self, path: str = None, sources: list = None, coalesce: bool = False):
+        super().__init__(path, sources, coalesce)
+        self.set_columns(
+            {name: array(typecode) for (name, typecode) in self.COLUMNS}, []
+        )
+
+    def set_columns(self, columns: dict, strings: List[str]) -> None:
+        """Use a set of (array-like) columns as the table contents,
+        creating the index columns if they're missing."""
+        if "asn_rows" not in columns:
+            columns = dict(columns)
+            (columns["asn_offsets"], columns["asn_rows"]) = self.create_index(
+                columns["asns"], len(strings)
+            )
+            (columns["country_offsets"], columns["country_rows"]) = self.create_index(
+                columns["countries"], len(strings)
+            )
+
+        self.columns = columns
+        self.strings = strings
+        self._refs = None
+        self._starts_hi = columns["starts_hi"]
+        self._starts_lo = columns["starts_lo"]
+        self._ends_hi = columns["ends_hi"]
+        self._ends_lo = columns["ends_lo"]
+        self._asns = columns["asns"]
+        self._countries = columns["countries"]
+        self._names = columns["names"]
+        self._asn_offsets = columns["asn_offsets"]
+        self._asn_rows = columns["asn_rows"]
+        self._country_offsets = columns["country_offsets"]
+        self._country_rows = columns["country_rows"]
+
+    @staticmethod
+    def create_index(keys, count: int):
+        """Group row numbers by their key (a string reference below
+        `count`), returning (offsets, rows) arrays where the rows for
+        key k are rows[offsets[k]:offsets[k + 1]]."""
+        rows = array("I", sorted(range(len(keys)), key=keys.__getitem__))
+        counts = Counter(keys)
+        offsets = array("I", [0])
+        offsets.extend(accumulate(counts.get(key, 0) for key in range(count)))
+        return (offsets, rows)
+
+    def _string_ref(self, value: str):
+        if self._refs is None:
+            self._refs = {string: ref for (ref, string) in enumerate(self.strings)}
+        return self._refs.get(value)
+
+    def _find_indexed(self, offsets, rows, value: str, limit: int = None) -> list:
+        ref = self._string_ref(value)
+        if ref is None:
+            return []
+        (start, end) = (offsets[ref], offsets[ref + 1])
+        if limit:
+            end = min(end, start + limit)
+        return [self.row(index) for index in rows[start:end]]
+
+    @classmethod
+    def from_rows(cls, data: list, strings: List[str], coalesce: bool = False):
+        """Create a table from sorted pooled rows."""
+        columns = {name: array(typecode) for (name, typecode) in cls.COLUMNS}
+        for (start, end, asn, country, name) in data:
+            columns["starts_hi"].append(start >> 64)
+            columns["starts_lo"].append(start & MASK64)
+            columns["ends_hi"].append(end >> 64)
+            columns["ends_lo"].append(end & MASK64)
+            columns["asns"].append(asn)
+            columns["countries"].append(country)
+            columns["names"].append(name)
+
+        table = cls(coalesce=coalesce)
+        table.set_columns(columns, strings)
+        return table
+
+    def build(self, table: "MemoryBackend") -> None:
+        self.set_columns(table.columns, table.strings)
+
+    def row(self, index: int) -> list:
+        """Return the decoded row at a given index."""
+        strings = self.strings
+        return [
+            (self._starts_hi[index] << 64) | self._starts_lo[index],
+            (self._ends_hi[index] << 64) | self._ends_lo[index],
+            strings[self._asns[index]],
+            strings[self._countries[index]],
+            strings[self._names[index]],
+        ]
+
+    def find(self, ip: int):
+        high = ip >> 64
+        # narrow down to the rows sharing our high half, then search the
+        # low halves; the row before that point is the only candidate
+        left = bisect_left(self._starts_hi, high)
+        right = bisect_right(self._starts_hi, high, left)
+        index = bisect_right(self._starts_lo, ip & MASK64, left, right) - 1
+        if index < 0:
+            return None
+        if ip > (self._ends_hi[index] << 64) | self._ends_lo[index]:
+            return None
+        return self.row(index)
+
+    def find_asn(self, asn: str, limit: int = None) -> list:
+        return self._find_indexed(self._asn_offsets, self._asn_rows, asn, limit)
+
+    def find_country(self, country: str, limit: int = None) -> list:
+        return self._find_indexed(
+            self._country_offsets, self._country_rows, country, limit
+        )
+
+    def countries(self) -> List[str]:
+        offsets = self._country_offsets
+        return sorted(
+            self.strings[ref]
+            for ref in range(len(offsets) - 1)
+            if offsets[ref + 1] > offsets[ref]
+        )
+
+    def to_rows(self):
+        data = [
+            [
+                (self._starts_hi[i] << 64) | self._starts_lo[i],
+                (self._ends_hi[i] << 64) | self._ends_lo[i],
+                self._asns[i],
+                self._countries[i],
+                self._names[i],
+            ]
+            for i in range(len(self))
+        ]
+        return (data, list(self.strings))
+
+    def to_table(self) -> "MemoryBackend":
+        return self
+
+    def __len__(self) -> int:
+        return len(self._starts_lo)
+
+
+class MmapBackend(MemoryBackend):
+    """The memory backend's columns, memory mapped from a file.
+
+    File layout: an 8 byte magic string, the 8 byte offset of a
+    msgpack header, the 8 byte aligned column arrays (in native byte
+    order) and finally the header describing them."""
+
+    name = "mmap"
+    extension = ".mmap"
+    MAGIC = b"IP2ASNMM"
+
+    def __init__(self, path: str = None, sources: list = None, coalesce: bool = False):
+        super().__init__(path, sources, coalesce)
+        self._tmpdir = None
+
+    def open(self) -> bool:
+        if not self.is_current():
+            return False
+        try:
+            return self.map_file()
+        except (OSError, ValueError, KeyError, TypeError, msgpack.UnpackException):
+            # an empty, truncated or otherwise damaged store gets rebuilt
+            return False
+
+    def map_file(self) -> bool:
+        """Map the columns of our store, if it is compatible."""
+        with open(self.path, "rb") as handle:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if mapped[:8] != self.MAGIC:
+            return False
+        header_offset = int.from_bytes(mapped[8:16], "little")
+        header = msgpack.unpackb(mapped[header_offset:])
+        if (
+            header["format"] != STORE_FORMAT
+            or header["byteorder"] != sys.byteorder
+            or header["coalesced"] != self.coalesce
+        ):
+            return False
+
+        view = memoryview(mapped)
+        columns = {}
+        for (name, typecode) in self.COLUMNS + self.INDEX_COLUMNS:
+            (offset, itemsize, length) = header["columns"][name]
+            if itemsize != array(typecode).itemsize:
+                return False
+            if offset + itemsize * length > len(mapped):
+                return False
+            columns[name] = view[offset : offset + itemsize * length].cast(typecode)
+        self.set_columns(columns, header["strings"])
+        return True
+
+    def build(self, table: MemoryBackend) -> None:
+        super().build(table)
+
+        header = {
+            "format": STORE_FORMAT,
+            "byteorder": sys.byteorder,
+            "coalesced": self.coalesce,
+            "strings": self.strings,
+            "columns": {},
+        }
+
+        def write(path):
+            with open(path, "wb") as out:
+                out.write(self.MAGIC)
+                out.write(bytes(8))
+                for (name, _) in self.COLUMNS + self.INDEX_COLUMNS:
+                    column = self.columns[name]
+                    out.write(bytes(-out.tell() % 8))
+                    header["columns"][name] = [out.tell(), column.itemsize, len(column)]
+                    out.write(column)
+                header_offset = out.tell()
+                out.write(msgpack.packb(header))
+                out.seek(8)
+                out.write(header_offset.to_bytes(8, "little"))
+
+        self.write_store(write)
+
+        # swap the freshly built arrays for the mapped file
+        if not self.map_file():
+            raise OSError(f"failed to map {self.path}")
+
+
+class SqliteBackend(Backend):
+    """Keeps the table in an sqlite database.  Range boundaries are
+    stored as 16 byte big-endian blobs so that they sort numerically:
+
+        SELECT asn, country, owner FROM ranges
+            WHERE start <= ? ORDER BY start DESC LIMIT 1
+    """
+
+    name = "sqlite"
+    extension = ".sqlite"
+
+    def __init__(self, path: str = None, sources: list = None, coalesce: bool = False):
+        super().__init__(path, sources, coalesce)
+        self._tmpdir = None
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                Path(self.path).absolute().as_uri() + "?mode=ro", uri=True
+            )
+            self._local.connection = connection
+        return connection
+
+    def open(self) -> bool:
+        if not self.is_current():
+            return False
+        try:
+            metadata = dict(
+                self._connection().execute("SELECT key, value FROM metadata")
+            )
+        except sqlite3.Error:
+            return False
+        return (
+            metadata.get("format") == STORE_FORMAT
+            and bool(metadata.get("coalesced")) == self.coalesce
+        )
+
+    def build(self, table: MemoryBackend) -> None:
+        # drop any connection made to a previous copy by open()
+        self._local = threading.local()
+
+        def write(path):
+            connection = sqlite3.connect(path)
+            try:
+                self.write_rows(connection, table)
+            finally:
+                connection.close()
+
+        self.write_store(write)
+        # (and to a sibling's copy, checked if ours couldn't be written)
+        self._local = threading.local()
+
+    def write_rows(self, connection, table: MemoryBackend) -> None:
+        """Fill a new sqlite database with the rows of a table."""
+        connection.executescript(
+            """
+            CREATE TABLE metadata (key TEXT PRIMARY KEY, value);
+            CREATE TABLE ranges (start BLOB, end BLOB, asn TEXT, country TEXT, owner TEXT);
+            """
+        )
+        connection.executemany(
+            "INSERT INTO metadata VALUES (?, ?)",
+            [("format", STORE_FORMAT), ("coalesced", int(self.coalesce))],
+        )
+        connection.executemany(
+            "INSERT INTO ranges VALUES (?, ?, ?, ?, ?)",
+            (
+                (start.to_bytes(16, "big"), end.to_bytes(16, "big"), asn, country, name)
+                for (start, end, asn, country, name) in (
+                    table.row(index) for index in range(len(table))
+                )
+            ),
+        )
+        connection.executescript(
+            """
+            CREATE INDEX ranges_start ON ranges (start);
+            CREATE INDEX ranges_asn ON ranges (asn, start);
+            CREATE INDEX ranges_country ON ranges (country, start);
+            """
+        )
+        connection.commit()
+
+    def _decode(self, row) -> list:
+        return [
+            int.from_bytes(row[0], "big"),
+            int.from_bytes(row[1], "big"),
+            row[2],
+            row[3],
+            row[4],
+        ]
+
+    def find(self, ip: int):
+        key = ip.to_bytes(16, "big")
+        row = (
+            self._connection()
+            .execute(
+                "SELECT start, end, asn, country, owner FROM ranges"
+                " WHERE start <= ? ORDER BY start DESC LIMIT 1",
+                (key,),
+            )
+            .fetchone()
+        )
+        if row is None or row[1] < key:
+            return None
+        return self._decode(row)
+
+    def find_asn(self, asn: str, limit: int = None) -> list:
+        rows = self._connection().execute(
+            "SELECT start, end, asn, country, owner FROM ranges"
+            " WHERE asn = ? ORDER BY start LIMIT ?",
+            (asn, limit or -1),
+        )
+        return [self._decode(row) for row in rows]
+
+    def find_country(self, country: str, limit: int = None) -> list:
+        rows = self._connection().execute(
+            "SELECT start, end, asn, country, owner FROM ranges"
+            " WHERE country = ? ORDER BY start LIMIT ?",
+            (country, limit or -1),
+        )
+        return [self._decode(row) for row in rows]
+
+    def countries(self) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT DISTINCT country FROM ranges ORDER BY country"
+        )
+        return [row[0] for row in rows]
+
+    def to_rows(self):
+        data = []
+        strings = []
+        refs = {}
+        rows = self._connection().execute(
+            "SELECT start, end, asn, country, owner FROM ranges ORDER BY start"
+        )
+        for row in rows:
+            row = self._decode(row)
+            for column in range(2, 5):
+                ref = refs.get(row[column])
+                if ref is None:
+                    ref = refs[row[column]] = len(strings)
+                    strings.append(row[column])
+                row[column] = ref
+            data.append(row)
+        return (data, strings)
+
+    def __len__(self) -> int:
+        if not self.path:
+            return 0
+        return self._connection().execute("SELECT COUNT(*) FROM ranges").fetchone()[0]
+
+
+BACKENDS = {
+    backend.name: backend for backend in [MemoryBackend, MmapBackend, SqliteBackend]
+}
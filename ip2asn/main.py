@@ -38,6 +38,15 @@ def parse_args():
         help="The ip2asn database file to use (download from iptoasn.com)",
     )
 
+    parser.add_argument(
+        "-O",
+        "--override-database",
+        type=str,
+        action="append",
+        default=[],
+        help="An additional ip2asn formatted file whose ranges take precedence over the main database (may be repeated; later files win)",
+    )
+
     parser.add_argument(
         "-a",
         "--search-by-asn",
@@ -45,12 +54,19 @@ def parse_args():
         help="Instead of searching by IP address, search by an ASN number instead and return all records for that ASN number",
     )
 
+    parser.add_argument(
+        "-c",
+        "--search-by-country",
+        action="store_true",
+        help="Instead of searching by IP address, search by a two letter country code and return all records for that country",
+    )
+
     parser.add_argument(
         "-A",
         "--asn-limit",
         type=int,
         default=0,
-        help="Search by ASN, but limit the results to this number -- implies -a",
+        help="Limit the results of an ASN (or, with -c, country) search to this number -- implies -a unless -c is given",
     )
 
     parser.add_argument(
@@ -75,6 +91,13 @@ def parse_args():
         help="Output the results as a libpcap / tcpdump filter expression",
     )
 
+    parser.add_argument(
+        "-N",
+        "--output-cidrs",
+        action="store_true",
+        help="Output the results as a collapsed list of CIDR prefixes, one per line",
+    )
+
     parser.add_argument(
         "-I",
         "--input-fsdb",
@@ -90,6 +113,21 @@ def parse_args():
         help="The input key of the FSDB input file that contains the ip address to analyze",
     )
 
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Read addresses (or ASNs with -a, or countries with -c) one per line from stdin and write results as they arrive; the database is loaded only once for the whole stream",
+    )
+
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        default=1000,
+        type=int,
+        help="With --stream, look up and flush at most this many lines at a time; the lines already waiting on stdin are always answered without waiting for more",
+    )
+
     parser.add_argument(
         "-C",
         "--cache-database",
@@ -97,6 +135,21 @@ def parse_args():
         help="After loading the ip2asn file, cache it in a msgpack file for faster loading next time.",
     )
 
+    parser.add_argument(
+        "-M",
+        "--coalesce",
+        action="store_true",
+        help="Merge adjacent database ranges that share the same ASN, country and owner",
+    )
+
+    parser.add_argument(
+        "-B",
+        "--backend",
+        default="memory",
+        choices=sorted(ip2asn.backends.BACKENDS),
+        help="Where to keep the loaded table: in memory, memory mapped from a file or in an sqlite database (both stored next to the database file)",
+    )
+
     parser.add_argument(
         "--log-level",
         "--ll",
@@ -110,7 +163,7 @@ def parse_args():
 
     args = parser.parse_args()
 
-    if args.asn_limit > 0:
+    if args.asn_limit > 0 and not args.search_by_country:
         args.search_by_asn = True
 
     log_level = args.log_level.upper()
@@ -183,32 +236,118 @@ def process_fsdb(i2a, inh, outh, key, by_asn=False):
         outf.out_column_names = inf.column_names + COLUMN_NAMES[1:]
 
     key_col = inf.get_column_number(key)
-    for row in inf:
-        if by_asn:
-            results = i2a.lookup_asn(row[key_col], limit=1)
-            if len(results) == 0:
-                row.extend(["-", "-", "-", "-", "-"])
-            else:
-                row.extend(
-                    [results[0]["owner"], results[0]["country"], results[0]["ip_range"]]
-                )
+    for row in i2a.enrich(inf, key_col, by_asn=by_asn):
+        outf.append(row)
 
+
+def process_stream(
+    i2a,
+    inh,
+    outh,
+    by_asn=False,
+    output_fsdb=False,
+    batch_size=1000,
+    asn_limit=0,
+    by_country=False,
+):
+    """Read addresses (or ASNs or countries) one per line from inh and
+    write the results to outh, flushing after every batch (see
+    read_batches)."""
+    outf = None
+    if output_fsdb:
+        outf = pyfsdb.Fsdb(out_file_handle=outh)
+        if by_asn or by_country:
+            outf.out_column_names = ASN_COLUMN_NAMES
         else:
-            result = i2a.lookup_address(row[key_col])
-
-            if result:
-                row.extend(
-                    [
-                        result["ip_numeric"],
-                        result["ASN"],
-                        result["owner"],
-                        result["country"],
-                        result["ip_range"],
-                    ]
+            outf.out_column_names = COLUMN_NAMES
+
+    for batch in read_batches(inh, batch_size):
+        output_stream_batch(i2a, outh, outf, batch, by_asn, asn_limit, by_country)
+
+
+def read_batches(inh, batch_size=1000):
+    """Yield lists of up to batch_size non-empty lines from inh.  When
+    inh is a real file or pipe, a batch only holds the lines that have
+    already arrived, so a slow producer never waits for a batch to fill
+    up before seeing its results."""
+    try:
+        fd = inh.fileno()
+    except (AttributeError, OSError):
+        fd = None
+
+    if fd is None:
+        batch = []
+        for line in inh:
+            line = line.strip()
+            if not line:
+                continue
+            batch.append(line)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+
+    # read whatever is available straight from the descriptor, which
+    # (unlike the line buffered handle) only blocks when nothing is
+    encoding = getattr(inh, "encoding", None) or "utf-8"
+    pending = b""
+    while True:
+        data = os.read(fd, 65536)
+        if not data:
+            break
+        (*lines, pending) = (pending + data).split(b"\n")
+        lines = [line.decode(encoding, "replace").strip() for line in lines]
+        lines = [line for line in lines if line]
+        for start in range(0, len(lines), batch_size):
+            yield lines[start : start + batch_size]
+
+    pending = pending.decode(encoding, "replace").strip()
+    if pending:
+        yield [pending]
+
+
+def output_stream_batch(i2a, outh, outf, batch, by_asn, asn_limit, by_country=False):
+    """Look up and write a single --stream batch."""
+    if by_country:
+        all_results = [
+            i2a.lookup_country(country, limit=asn_limit) for country in batch
+        ]
+    elif by_asn:
+        all_results = [i2a.lookup_asn(asn, limit=asn_limit) for asn in batch]
+    else:
+        all_results = [
+            [result] if result else []
+            for result in i2a.lookup_many(batch, skip_invalid=True)
+        ]
+
+    for key, results in zip(batch, all_results):
+        if not results:
+            if outf:
+                if by_asn or by_country:
+                    outf.append([key, "-", "-", "-"])
+                else:
+                    outf.append([key, "-", "-", "-", "-", "-"])
+            elif by_country:
+                outh.write(
+                    "ERROR: country '{}' has no ranges in the database\n".format(key)
                 )
             else:
-                row.extend(["-", "-", "-", "-", "-"])
-        outf.append(row)
+                outh.write(
+                    "ERROR: {} '{}' was not found in the database\n".format(
+                        "ASN" if by_asn else "address", key
+                    )
+                )
+            continue
+
+        for result in results:
+            if outf:
+                output_fsdb_row(outf, key, result)
+            else:
+                print_result(outh, key, result)
+
+    outh.flush()
 
 
 def get_ip2asn_db_path(args, exit_on_error: bool = True):
@@ -267,7 +406,11 @@ def main():
         sys.exit()
 
     i2a = ip2asn.IP2ASN(
-        str(database), ipversion=None, cache_contents=args.cache_database
+        [str(database)] + args.override_database,
+        ipversion=None,
+        cache_contents=args.cache_database,
+        coalesce=args.coalesce,
+        backend=args.backend,
     )
 
     if args.input_fsdb:
@@ -276,16 +419,42 @@ def main():
         )
         sys.exit()
 
+    if args.stream:
+        process_stream(
+            i2a,
+            sys.stdin,
+            args.output_file,
+            by_asn=args.search_by_asn,
+            output_fsdb=args.output_fsdb,
+            batch_size=args.batch_size,
+            asn_limit=args.asn_limit,
+            by_country=args.search_by_country,
+        )
+        sys.exit()
+
     if args.output_fsdb:
         outf = pyfsdb.Fsdb(out_file_handle=args.output_file)
-        if args.search_by_asn:
+        if args.search_by_asn or args.search_by_country:
             outf.out_column_names = ASN_COLUMN_NAMES
         else:
             outf.out_column_names = COLUMN_NAMES
 
     for address in args.addresses:
+        if args.search_by_country and args.output_cidrs and not args.asn_limit:
+            (cidrs,) = i2a.export_country_cidrs([address]).values()
+            if not cidrs:
+                print("ERROR: country '{}' has no ranges in the database".format(address))
+            for cidr in cidrs:
+                args.output_file.write(cidr + "\n")
+            continue
+
         if args.search_by_asn:
             results = i2a.lookup_asn(address, limit=args.asn_limit)
+        elif args.search_by_country:
+            results = i2a.lookup_country(address, limit=args.asn_limit)
+            if not results:
+                print("ERROR: country '{}' has no ranges in the database".format(address))
+                continue
         else:
             result = i2a.lookup_address(address)
 
@@ -299,6 +468,9 @@ def main():
 
         if args.output_pcap_filter:
             output_pcap_filter(results)
+        elif args.output_cidrs:
+            for cidr in i2a.ranges_to_cidrs([result["ip_range"] for result in results]):
+                args.output_file.write(cidr + "\n")
         else:
             for result in results:
                 if args.output_fsdb:
@@ -0,0 +1,71 @@
+"""Sample rows and fixtures shared by the ip2asn tests."""
+
+import pytest
+
+
+@pytest.fixture
+def rows():
+    """The v4 (numeric) and v6 sample rows as one database."""
+    return """16777216	16777471	13335	US	CLOUDFLARENET - Cloudflare, Inc.
+16777472	16778239	0	None	Not routed
+16778240	16779263	56203	AU	GTELECOM-AUSTRALIA Gtelecom-AUSTRALIA
+16779264	16781311	0	None	Not routed
+16781312	16781567	2519	JP	VECTANT ARTERIA Networks Corporation
+16781568	16793599	0	None	Not routed
+16793600	16809983	18144	JP	AS-ENECOM Energia Communications,Inc.
+16809984	16834047	23969	TH	TOT-NET TOT Public Company Limited
+16834048	16842751	23969	TH	TOT-NET TOT Public Company Limited
+16842752	16843007	0	None	Not routed
+16843008	16843008	13335	US	CLOUDFLARENET - Cloudflare, Inc.
+16843009	16843009	7497	CN	CSTNET-AS-AP Computer Network Information Center
+16843010	16843263	13335	US	CLOUDFLARENET - Cloudflare, Inc.
+16843264	16844287	0	None	Not routed
+16844288	16844543	138449	HK	SYUNET-AS-AP SIANG YU SCIENCE AND TECHNOLOGY LIMITED
+16844544	16844799	0	None	Not routed
+16844800	16845055	4134	CN	CHINANET-BACKBONE No.31,Jin-rong Street
+16845056	16847871	0	None	Not routed
+16847872	16848127	133948	HK	DIL-AS-AP DONGFONG INC LIMITED
+16848128	16859135	0	None	Not routed
+::	::1	0	None	Not routed
+64:ff9b::1:0:0	100::ffff:ffff:ffff:ffff	0	None	Not routed
+100:0:0:1::	2001:0:ffff:ffff:ffff:ffff:ffff:ffff	0	None	Not routed
+2001:1::	2001:4:111:ffff:ffff:ffff:ffff:ffff	0	None	Not routed
+2001:4:112::	2001:4:112:ffff:ffff:ffff:ffff:ffff	112	US	ROOTSERV - DNS-OARC
+2001:4:113::	2001:c0:2:ffff:ffff:ffff:ffff:ffff	0	None	Not routed
+2001:c0:3::	2001:c0:3:ffff:ffff:ffff:ffff:ffff	22884	MX	TOTAL PLAY TELECOMUNICACIONES SA DE CV
+2001:c0:4::	2001:1ff:ffff:ffff:ffff:ffff:ffff:ffff	0	None	Not routed
+2001:200::	2001:200:5ff:ffff:ffff:ffff:ffff:ffff	2500	JP	WIDE-BB WIDE Project
+2001:200:600::	2001:200:6ff:ffff:ffff:ffff:ffff:ffff	7667	JP	KDDLAB KDDI R&D Laboratories, INC.
+2001:200:700::	2001:200:8ff:ffff:ffff:ffff:ffff:ffff	2500	JP	WIDE-BB WIDE Project
+2001:200:900::	2001:200:9ff:ffff:ffff:ffff:ffff:ffff	7660	JP	APAN-JP Asia Pacific Advanced Network - Japan
+2001:200:a00::	2001:200:bfff:ffff:ffff:ffff:ffff:ffff	2500	JP	WIDE-BB WIDE Project
+2001:200:c000::	2001:200:dfff:ffff:ffff:ffff:ffff:ffff	23634	JP	E-DNS-JP WIDE Project
+2001:200:e000::	2001:200:ffff:ffff:ffff:ffff:ffff:ffff	7660	JP	APAN-JP Asia Pacific Advanced Network - Japan
+2001:201::	2001:217:ffff:ffff:ffff:ffff:ffff:ffff	0	None	Not routed
+2001:218::	2001:218:21ff:ffff:ffff:ffff:ffff:ffff	2914	US	NTT-COMMUNICATIONS-2914 - NTT America, Inc.
+2001:218:2200::	2001:218:22ff:ffff:ffff:ffff:ffff:ffff	18259	JP	HIGE NTT Communications Corporation
+2001:218:2300::	2001:218:3003:ffff:ffff:ffff:ffff:ffff	2914	US	NTT-COMMUNICATIONS-2914 - NTT America, Inc.
+2001:218:3004::	2001:218:3004:ffff:ffff:ffff:ffff:ffff	20940	EU	AKAMAI-ASN1
+"""
+
+
+@pytest.fixture
+def database(tmp_path, rows):
+    """The sample rows written to a database file."""
+    database = tmp_path / "database.tsv"
+    database.write_text(rows)
+    return str(database)
+
+
+@pytest.fixture
+def i2a(database):
+    """An IP2ASN instance loaded from the sample database."""
+    import ip2asn
+
+    return ip2asn.IP2ASN(database)
+
+
+@pytest.fixture(params=["memory", "mmap", "sqlite"])
+def backend(request):
+    """Each of the storage backends in turn."""
+    return request.param
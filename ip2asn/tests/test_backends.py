@@ -0,0 +1,156 @@
+import io
+import os
+import pytest
+
+ADDRESSES = [
+    "1.0.0.1",
+    "1.0.200.1",
+    "1.1.1.1",
+    "1.1.1.2",
+    "1.1.2.0",
+    "9.9.9.9",
+    "2001:200::42",
+    "2001:200:6ff::1",
+    "2001:218:3004::1",
+    "2001:218:3005::1",
+    "::1",
+]
+
+
+def test_backend_lookups(database, rows, backend):
+    import ip2asn
+
+    expected = ip2asn.IP2ASN(io.StringIO(rows)).lookup_many(ADDRESSES)
+    assert expected[0]["ASN"] == "13335"
+    assert expected[5] is None
+    assert expected[8]["ASN"] == "20940", "the last range can be found"
+    assert expected[9] is None
+
+    i2a = ip2asn.IP2ASN(database, backend=backend)
+    assert len(i2a) == 40
+    assert i2a.lookup_many(ADDRESSES) == expected
+    assert i2a.lookup_many_threaded(ADDRESSES * 10, chunk_size=5) == expected * 10
+    assert i2a.lookup_address_row("1.1.1.1")[2:] == [
+        "7497",
+        "CN",
+        "CSTNET-AS-AP Computer Network Information Center",
+    ]
+
+    assert [x["ip_range"] for x in i2a.lookup_asn(23969)] == [
+        [16809984, 16834047],
+        [16834048, 16842751],
+    ]
+    assert len(i2a.lookup_asn("23969", limit=1)) == 1
+    assert i2a.lookup_asn("65000") == []
+
+    i2a = ip2asn.IP2ASN(database, backend=backend, coalesce=True)
+    assert len(i2a) == 37
+    assert i2a.lookup_address("1.0.200.1")["ip_range"] == [16809984, 16842751]
+
+
+def test_backend_in_memory_source(rows, backend):
+    import ip2asn
+
+    i2a = ip2asn.IP2ASN(io.StringIO(rows), backend=backend)
+    assert i2a.lookup_address("1.1.1.1")["ASN"] == "7497"
+
+
+@pytest.mark.parametrize("backend", ["mmap", "sqlite"])
+def test_backend_store_reuse(database, backend):
+    import ip2asn
+
+    ip2asn.IP2ASN(database, backend=backend)
+    store = database + "." + backend
+    assert os.path.exists(store)
+
+    # the store is used without the original
+    os.rename(database, database + ".orig")
+    i2a = ip2asn.IP2ASN(database, backend=backend)
+    assert i2a.lookup_address("1.1.1.1")["ASN"] == "7497"
+
+    # and rebuilt when the original is newer
+    with open(database, "w") as out:
+        out.write("16843008\t16843263\t64512\tZZ\tREPLACED\n")
+    os.utime(store, (0, 0))
+    i2a = ip2asn.IP2ASN(database, backend=backend)
+    assert len(i2a) == 1
+    assert i2a.lookup_address("1.1.1.1")["ASN"] == "64512"
+
+
+@pytest.mark.parametrize("backend", ["mmap", "sqlite"])
+@pytest.mark.parametrize("damage", ["empty", "truncated", "garbage"])
+def test_backend_damaged_store(database, backend, damage):
+    import ip2asn
+
+    ip2asn.IP2ASN(database, backend=backend)
+    store = database + "." + backend
+    with open(store, "rb") as handle:
+        contents = handle.read()
+    with open(store, "wb") as handle:
+        if damage == "truncated":
+            handle.write(contents[: len(contents) // 2])
+        elif damage == "garbage":
+            handle.write(contents[:16] + b"\xc1" * 64)
+
+    # the store is rebuilt rather than failing to load
+    i2a = ip2asn.IP2ASN(database, backend=backend)
+    assert i2a.lookup_address("1.1.1.1")["ASN"] == "7497"
+    assert len(i2a) == 40
+
+
+def test_unknown_backend(rows):
+    import ip2asn
+
+    with pytest.raises(ValueError):
+        ip2asn.IP2ASN(io.StringIO(rows), backend="bogus")
+
+
+def build_store(database, backend):
+    import ip2asn
+
+    return ip2asn.IP2ASN(database, backend=backend).lookup_address("1.1.1.1")["ASN"]
+
+
+@pytest.mark.parametrize("backend", ["mmap", "sqlite"])
+def test_backend_concurrent_builds(database, backend):
+    import multiprocessing
+
+    # like preforked workers all starting on a fresh database
+    with multiprocessing.get_context("fork").Pool(6) as pool:
+        results = pool.starmap(build_store, [(database, backend)] * 6)
+    assert results == ["7497"] * 6
+    assert [x for x in os.listdir(os.path.dirname(database)) if "new" in x] == []
+
+
+@pytest.mark.parametrize("backend", ["mmap", "sqlite"])
+def test_backend_unwritable_store(database, backend, monkeypatch):
+    import ip2asn
+    import tempfile
+
+    def mkstemp(*args, **kwargs):
+        raise PermissionError("read only directory")
+
+    monkeypatch.setattr(tempfile, "mkstemp", mkstemp)
+    i2a = ip2asn.IP2ASN(database, backend=backend)
+    assert i2a.lookup_address("1.1.1.1")["ASN"] == "7497"
+    assert not os.path.exists(database + "." + backend)
+
+
+@pytest.mark.parametrize("backend", ["mmap", "sqlite"])
+def test_backend_store_replaced_by_sibling(database, backend, monkeypatch):
+    import ip2asn
+
+    ip2asn.IP2ASN(database, backend=backend)
+    os.utime(database, None)
+    future = os.path.getmtime(database) + 10
+
+    def replace(source, destination):
+        # another process finished the same store just before us
+        os.utime(destination, (future, future))
+        raise FileNotFoundError(destination)
+
+    monkeypatch.setattr(os, "replace", replace)
+    os.utime(database, (future - 5, future - 5))
+    i2a = ip2asn.IP2ASN(database, backend=backend)
+    assert i2a._backend.path == database + "." + backend
+    assert i2a.lookup_address("1.1.1.1")["ASN"] == "7497"
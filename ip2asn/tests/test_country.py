@@ -0,0 +1,120 @@
+import io
+import os
+import pytest
+
+
+def test_lookup_country(database, backend):
+    import ip2asn
+
+    i2a = ip2asn.IP2ASN(database, backend=backend)
+    assert [x["ip_range"] for x in i2a.lookup_country("CN")] == [
+        [16843009, 16843009],
+        [16844800, 16845055],
+    ]
+    assert i2a.lookup_country("CN")[1]["ASN"] == "4134"
+    assert len(i2a.lookup_country("JP")) == 10
+    assert len(i2a.lookup_country("JP", limit=2)) == 2
+    assert i2a.lookup_country("ZZ") == []
+    assert i2a.lookup_country("cn") == i2a.lookup_country("CN")
+    assert i2a.lookup_country_asns("cn") == ["4134", "7497"]
+
+    assert i2a.lookup_country_asns("CN") == ["4134", "7497"]
+    assert i2a.lookup_country_asns("US") == ["112", "2914", "13335"]
+    assert i2a._backend.countries() == [
+        "AU", "CN", "EU", "HK", "JP", "MX", "None", "TH", "US"
+    ]
+
+
+def test_export_country_cidrs(database, backend):
+    import ip2asn
+
+    i2a = ip2asn.IP2ASN(database, backend=backend)
+    cidrs = i2a.export_country_cidrs(["CN", "JP"])
+    assert cidrs == {
+        "CN": ["1.1.1.1/32", "1.1.8.0/24"],
+        "JP": ["1.0.16.0/24", "1.0.64.0/18", "2001:200::/32", "2001:218:2200::/40"],
+    }
+    assert i2a.export_country_cidrs(["CN"])["CN"] is cidrs["CN"], "results are kept"
+    assert i2a.export_country_cidrs(["cn"]) == {"CN": cidrs["CN"]}
+    assert len(i2a.export_country_cidrs()) == 9
+
+
+def test_ranges_to_cidrs(rows):
+    import ip2asn
+
+    i2a = ip2asn.IP2ASN(io.StringIO(rows))
+    assert i2a.ranges_to_cidrs([]) == []
+    assert i2a.ranges_to_cidrs([[0, 2**32 - 1]]) == ["0.0.0.0/0"]
+    # overlapping and adjacent ranges collapse together
+    assert i2a.ranges_to_cidrs([[16777216, 16777471], [16777472, 16777727],
+                                [16777300, 16777400]]) == ["1.0.0.0/23"]
+    assert i2a.ranges_to_cidrs([[16777217, 16777218]]) == ["1.0.0.1/32", "1.0.0.2/32"]
+    assert i2a.ranges_to_cidrs([[16843010, 16843263]])[:2] == ["1.1.1.2/31", "1.1.1.4/30"]
+
+
+@pytest.mark.parametrize("backend", ["memory", "mmap"])
+def test_country_index_is_stored(database, backend):
+    import ip2asn
+
+    ip2asn.IP2ASN(database, backend=backend, cache_contents=True)
+    os.rename(database, database + ".orig")
+
+    # the indexes come back from the stored copy
+    i2a = ip2asn.IP2ASN(database, backend=backend)
+    assert "country_rows" in i2a._backend.columns
+    assert len(i2a.lookup_country("JP")) == 10
+
+
+def test_country_cidrs_are_cached(database):
+    import ip2asn
+    import msgpack
+
+    i2a = ip2asn.IP2ASN(database, cache_contents=True)
+    assert i2a.export_country_cidrs(["TH"]) == {"TH": ["1.0.128.0/17"]}
+    cidrs_file = database + ".cidrs.msgpack"
+    assert os.path.exists(cidrs_file)
+
+    # later exports start from the saved lists
+    with open(cidrs_file, "rb") as cache:
+        contents = msgpack.load(cache)
+    contents["countries"]["TH"] = ["192.0.2.0/24"]
+    with open(cidrs_file, "wb") as cache:
+        msgpack.dump(contents, cache)
+
+    i2a = ip2asn.IP2ASN(database, cache_contents=True)
+    assert i2a.export_country_cidrs(["TH"]) == {"TH": ["192.0.2.0/24"]}
+    assert ip2asn.IP2ASN(database).export_country_cidrs(["TH"]) == {
+        "TH": ["1.0.128.0/17"]
+    }
+
+    # and they're thrown away when the database changes
+    os.utime(cidrs_file, (0, 0))
+    i2a = ip2asn.IP2ASN(database, cache_contents=True)
+    assert i2a.export_country_cidrs(["TH"]) == {"TH": ["1.0.128.0/17"]}
+
+
+def test_unwritable_country_cidrs_cache(database):
+    import ip2asn
+    from unittest import mock
+
+    i2a = ip2asn.IP2ASN(database, cache_contents=True)
+    files = sorted(os.listdir(os.path.dirname(database)))
+    with mock.patch("tempfile.mkstemp", side_effect=PermissionError):
+        assert i2a.export_country_cidrs(["TH"]) == {"TH": ["1.0.128.0/17"]}
+    assert sorted(os.listdir(os.path.dirname(database))) == files
+
+
+def test_country_command_line(database, monkeypatch, capsys):
+    from ip2asn.main import main
+
+    def run(*args):
+        monkeypatch.setattr("sys.argv", ["ip2asn", "-f", database, *args])
+        main()
+        return capsys.readouterr().out
+
+    output = run("-c", "jp", "-A", "1")
+    assert output.count("Country: JP") == 1
+    assert "ASN: 2519" in output
+
+    assert run("-c", "-N", "cn").split() == ["1.1.1.1/32", "1.1.8.0/24"]
+    assert "country 'zz' has no ranges" in run("-c", "zz")
@@ -0,0 +1,77 @@
+import asyncio
+import io
+
+INPUT = [["a", "1.1.1.1"], ["b", "9.9.9.9"], ["c", "1.1.1.2"]]
+
+EXPECTED = [
+    ["a", "1.1.1.1", 16843009, "7497", "CSTNET-AS-AP Computer Network Information Center", "CN", [16843009, 16843009]],
+    ["b", "9.9.9.9", "-", "-", "-", "-", "-"],
+    ["c", "1.1.1.2", 16843010, "13335", "CLOUDFLARENET - Cloudflare, Inc.", "US", [16843010, 16843263]],
+]
+
+
+def test_enrich(i2a):
+    rows = [list(row) for row in INPUT]
+    assert list(i2a.enrich(rows, 1, batch_size=2)) == EXPECTED
+
+
+def test_enrich_is_lazy(i2a):
+    pulled = []
+
+    def source():
+        for row in INPUT:
+            pulled.append(row[0])
+            yield list(row)
+
+    enriched = i2a.enrich(source(), 1, batch_size=2)
+    assert next(enriched) == EXPECTED[0]
+    assert pulled == ["a", "b"], "only the first batch was read"
+    assert list(enriched) == EXPECTED[1:]
+
+
+def test_enrich_by_asn(i2a):
+    rows = [["13335"], ["65000"]]
+    assert list(i2a.enrich(rows, 0, by_asn=True)) == [
+        ["13335", "CLOUDFLARENET - Cloudflare, Inc.", "US", [16777216, 16777471]],
+        ["65000", "-", "-", "-"],
+    ]
+
+
+def test_enrich_async(i2a):
+    async def source():
+        for row in INPUT:
+            await asyncio.sleep(0)
+            yield list(row)
+
+    async def collect(rows):
+        return [row async for row in i2a.enrich_async(rows, 1, batch_size=2)]
+
+    assert asyncio.run(collect(source())) == EXPECTED
+    assert asyncio.run(collect([list(row) for row in INPUT])) == EXPECTED
+
+
+def test_process_fsdb(i2a):
+    from ip2asn.main import process_fsdb
+
+    inh = io.StringIO("#fsdb -F t name key\na\t1.1.1.1\nb\t9.9.9.9\n")
+    outh = io.StringIO()
+    outh.close = lambda: None
+    process_fsdb(i2a, inh, outh, "key")
+
+    lines = outh.getvalue().split("\n")
+    assert lines[0].split()[-1] == "ip_range"
+    assert lines[1].split("\t")[:4] == ["a", "1.1.1.1", "16843009", "7497"]
+    assert lines[2].split("\t") == ["b", "9.9.9.9", "-", "-", "-", "-", "-"]
+
+
+def test_enrich_bad_addresses(i2a):
+    import pytest
+
+    rows = [["a", "1.1.1.1"], ["x", "hostname.example"], ["c", "1.1.1.2"]]
+    enriched = list(i2a.enrich([list(row) for row in rows], 1, batch_size=3))
+    assert enriched[0] == EXPECTED[0]
+    assert enriched[1] == ["x", "hostname.example", "-", "-", "-", "-", "-"]
+    assert enriched[2] == EXPECTED[2]
+
+    with pytest.raises(ValueError):
+        list(i2a.enrich([list(row) for row in rows], 1, skip_invalid=False))
@@ -173,3 +173,149 @@ class test_ip2asn(unittest.TestCase):
                            'country': 'US', 
                            'owner': 'NTT-COMMUNICATIONS-2914 - NTT America, Inc.'}], 
                          "returned expected results")
+
+    def test_string_pool(self):
+        import ip2asn
+        i2a = ip2asn.IP2ASN(self.get_first_20_rows_v4_ints())
+
+        (data, strings) = i2a._backend.to_rows()
+        self.assertEqual(strings.count("Not routed"), 1,
+                         "repeated owners are stored once")
+        self.assertTrue(all(isinstance(x, int) for x in data[0]),
+                        "rows only hold numbers")
+        self.assertEqual(i2a.lookup_address_row("1.1.1.2"),
+                         [16843010, 16843263, '13335', 'US',
+                          'CLOUDFLARENET - Cloudflare, Inc.'],
+                         "rows are returned decoded")
+
+    def test_msgpack_cache(self):
+        import ip2asn
+        import msgpack
+        import os
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database = os.path.join(tmpdir, "database.tsv")
+            with open(database, "w") as out:
+                out.write(self.get_first_20_rows_v4_ints().getvalue())
+
+            i2a = ip2asn.IP2ASN(database, cache_contents=True)
+            expected = i2a.lookup_address("1.1.1.2")
+
+            # columns are stored as raw blobs
+            with open(database + ".msgpack", "rb") as cache:
+                contents = msgpack.load(cache)
+            self.assertEqual(len(contents["columns"]["starts_lo"]["data"]),
+                             20 * 8)
+            self.assertEqual(contents["format"], ip2asn.CACHE_FORMAT)
+
+            # make sure the original isn't used
+            os.unlink(database)
+            i2a = ip2asn.IP2ASN(database)
+            self.assertEqual(i2a.lookup_address("1.1.1.2"), expected)
+            self.assertEqual(len(i2a.lookup_asn(13335)), 3)
+
+            # older caches didn't pool their strings
+            (data, strings) = i2a._backend.to_rows()
+            legacy_data = [row[:2] + [strings[x] for x in row[2:]] for row in data]
+            with open(database + ".msgpack", "wb") as out:
+                msgpack.pack({
+                    "version": "1.6.6",
+                    "data": legacy_data,
+                    "left_keys": [row[0] for row in data],
+                    "start_col": 0,
+                    "end_col": 1,
+                    "asn_col": 2,
+                    "country_col": 3,
+                    "name_col": 4,
+                }, out)
+
+            i2a = ip2asn.IP2ASN(database)
+            self.assertEqual(i2a.lookup_address("1.1.1.2"), expected)
+
+            # and caches in a newer format are ignored, not misread
+            with open(database + ".msgpack", "wb") as out:
+                msgpack.pack({"version": "99", "format": ip2asn.CACHE_FORMAT + 1}, out)
+            self.assertIsNone(i2a.read_msgpack_file())
+
+    def test_damaged_msgpack_cache(self):
+        import ip2asn
+        import msgpack
+        import os
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database = os.path.join(tmpdir, "database.tsv")
+            with open(database, "w") as out:
+                out.write(self.get_first_20_rows_v4_ints().getvalue())
+            cache_file = database + ".msgpack"
+
+            ip2asn.IP2ASN(database, cache_contents=True)
+            with open(cache_file, "rb") as cache:
+                contents = cache.read()
+
+            # a truncated cache
+            with open(cache_file, "wb") as cache:
+                cache.write(contents[: len(contents) // 2])
+            i2a = ip2asn.IP2ASN(database)
+            self.assertEqual(len(i2a), 20, "the database was reread")
+
+            # and one with the wrong column sizes
+            unpacked = msgpack.unpackb(contents)
+            unpacked["columns"]["asns"]["itemsize"] = 2
+            with open(cache_file, "wb") as cache:
+                msgpack.pack(unpacked, cache)
+            i2a = ip2asn.IP2ASN(database)
+            self.assertEqual(i2a.lookup_address("1.1.1.1")["ASN"], "7497")
+
+    def test_unwritable_msgpack_cache(self):
+        import ip2asn
+        import os
+        import tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database = os.path.join(tmpdir, "database.tsv")
+            with open(database, "w") as out:
+                out.write(self.get_first_20_rows_v4_ints().getvalue())
+
+            with mock.patch("tempfile.mkstemp", side_effect=PermissionError):
+                i2a = ip2asn.IP2ASN(database, cache_contents=True)
+            self.assertEqual(i2a.lookup_address("1.1.1.1")["ASN"], "7497")
+            self.assertEqual(os.listdir(tmpdir), ["database.tsv"])
+
+    def test_coalesce(self):
+        import ip2asn
+        i2a = ip2asn.IP2ASN(self.get_first_20_rows_v4_ints())
+        self.assertEqual(len(i2a), 20, "raw rows are kept by default")
+        self.assertEqual(i2a.lookup_address("1.0.200.1")["ip_range"],
+                         [16809984, 16834047])
+
+        i2a = ip2asn.IP2ASN(self.get_first_20_rows_v4_ints(), coalesce=True)
+        self.assertEqual(len(i2a), 19, "the TOT-NET rows were merged")
+        self.assertEqual(i2a.lookup_address("1.0.200.1")["ip_range"],
+                         [16809984, 16842751])
+        self.assertEqual(i2a.lookup_address("1.0.255.1")["ip_range"],
+                         [16809984, 16842751])
+        self.assertEqual(i2a.lookup_address("1.1.1.1")["ASN"], "7497",
+                         "non-identical neighbors are not merged")
+
+    def test_coalesce_cache(self):
+        import ip2asn
+        import os
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database = os.path.join(tmpdir, "database.tsv")
+            with open(database, "w") as out:
+                out.write(self.get_first_20_rows_v4_ints().getvalue())
+
+            # a raw cache can be coalesced after loading
+            ip2asn.IP2ASN(database, cache_contents=True)
+            i2a = ip2asn.IP2ASN(database, coalesce=True)
+            self.assertEqual(len(i2a), 19)
+
+            # but a coalesced cache can't be used for raw rows
+            ip2asn.IP2ASN(database, cache_contents=True, coalesce=True)
+            i2a = ip2asn.IP2ASN(database)
+            self.assertEqual(len(i2a), 20)
@@ -0,0 +1,126 @@
+import io
+import os
+
+# cuts into one TOT-NET range, and spans the end of the public data
+LOCAL = """16810000	16810255	64512	ZZ	INTERNAL lab network
+16859000	16859391	64513	ZZ	INTERNAL customer network
+"""
+
+
+def ranges(i2a, low=16809984, high=2**32):
+    (data, strings) = i2a._backend.to_rows()
+    return [
+        [row[0], row[1], strings[row[2]]]
+        for row in data
+        if row[1] >= low and row[0] < high
+    ]
+
+
+def test_merge_splits_ranges(rows):
+    import ip2asn
+
+    i2a = ip2asn.IP2ASN([io.StringIO(rows), io.StringIO(LOCAL)])
+    assert ranges(i2a, high=16834048) == [
+        [16809984, 16809999, "23969"],
+        [16810000, 16810255, "64512"],
+        [16810256, 16834047, "23969"],
+    ]
+    assert ranges(i2a, low=16848128) == [
+        [16848128, 16858999, "0"],
+        [16859000, 16859391, "64513"],
+    ]
+    assert len(i2a) == 43
+    assert i2a.lookup_address("1.0.128.20")["owner"] == "INTERNAL lab network"
+    assert i2a.lookup_address("1.0.128.15")["ASN"] == "23969"
+    assert i2a.lookup_address("1.1.64.1")["ASN"] == "64513"
+    assert i2a.lookup_address("2001:200::42")["ASN"] == "2500"
+
+
+def test_merge_priorities(rows):
+    import ip2asn
+
+    # the public data has the higher priority this time
+    i2a = ip2asn.IP2ASN([(io.StringIO(rows), 10), (io.StringIO(LOCAL), 1)])
+    assert i2a.lookup_address("1.0.128.20")["ASN"] == "23969"
+    assert i2a.lookup_address("1.1.63.255")["ASN"] == "0"
+    assert i2a.lookup_address("1.1.64.1")["ASN"] == "64513", "gaps are filled"
+    assert len(i2a) == 41
+
+    i2a = ip2asn.IP2ASN([io.StringIO(rows), io.StringIO(LOCAL)], coalesce=True)
+    assert len(i2a) == 40, "the TOT-NET pieces were joined back up"
+
+
+def test_merge_caches(tmp_path, database, backend):
+    import ip2asn
+
+    local = tmp_path / "local.tsv"
+    local.write_text(LOCAL)
+    sources = [database, str(local)]
+
+    i2a = ip2asn.IP2ASN(sources, cache_contents=True, backend=backend)
+    assert i2a.lookup_address("1.0.128.20")["ASN"] == "64512"
+    assert os.path.exists(database + ".msgpack")
+    assert os.path.exists(str(local) + ".msgpack")
+    merged_cache = i2a.store_name(".msgpack")
+    assert os.path.exists(merged_cache)
+
+    # the merged result is reused as is
+    os.rename(database, database + ".orig")
+    i2a = ip2asn.IP2ASN(sources, backend=backend)
+    assert i2a.lookup_address("1.0.128.20")["ASN"] == "64512"
+
+    # and editing the local overrides only rereads those
+    local.write_text("16810000\t16810255\t64514\tZZ\tINTERNAL moved\n")
+    future = os.path.getmtime(merged_cache) + 10
+    os.utime(local, (future, future))
+    i2a = ip2asn.IP2ASN(sources, backend=backend)
+    assert i2a.lookup_address("1.0.128.20")["ASN"] == "64514"
+    assert i2a.lookup_address("1.0.255.255")["ASN"] == "23969"
+    assert i2a.lookup_address("1.1.64.1") is None
+
+    # a different set of sources doesn't share the merged cache
+    assert ip2asn.IP2ASN(sources[::-1]).store_name(".msgpack") != merged_cache
+
+
+# more specific ranges nested inside the ones they override
+NESTED = """10.0.0.0	10.255.255.255	64512	ZZ	INTERNAL
+10.1.0.0	10.1.0.255	64513	ZZ	CUSTOMER
+1.0.0.0	1.0.255.255	64514	ZZ	INT2
+1.0.1.0	1.0.1.255	64515	ZZ	CUST2
+"""
+
+
+def test_merge_nested_overrides(rows):
+    import ip2asn
+
+    i2a = ip2asn.IP2ASN([io.StringIO(rows), io.StringIO(NESTED)])
+    assert i2a.lookup_address("10.0.0.1")["owner"] == "INTERNAL"
+    assert i2a.lookup_address("10.1.0.1")["owner"] == "CUSTOMER"
+    assert i2a.lookup_address("10.2.0.1")["owner"] == "INTERNAL"
+    assert i2a.lookup_address("10.255.255.255")["owner"] == "INTERNAL"
+    assert i2a.lookup_address("1.0.0.5")["owner"] == "INT2"
+    assert i2a.lookup_address("1.0.1.5")["owner"] == "CUST2"
+    assert i2a.lookup_address("1.0.2.5")["owner"] == "INT2"
+    assert i2a.lookup_address("1.1.1.1")["ASN"] == "7497"
+
+    assert ranges(i2a, low=16777216, high=16843008) == [
+        [16777216, 16777471, "64514"],
+        [16777472, 16777727, "64515"],
+        [16777728, 16842751, "64514"],
+        [16842752, 16843007, "0"],
+    ]
+
+
+def test_flatten_rows(rows):
+    import ip2asn
+
+    i2a = ip2asn.IP2ASN(io.StringIO(rows))
+    assert i2a.flatten_rows([[0, 9, "a"], [2, 3, "b"], [3, 3, "c"], [5, 12, "d"]]) == [
+        [0, 1, "a"],
+        [2, 2, "b"],
+        [3, 3, "c"],
+        [4, 4, "a"],
+        [5, 12, "d"],
+    ]
+    # duplicates keep the last one
+    assert i2a.flatten_rows([[0, 9, "a"], [0, 9, "b"]]) == [[0, 9, "b"]]
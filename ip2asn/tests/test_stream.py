@@ -0,0 +1,102 @@
+import io
+
+
+class FlushCounter(io.StringIO):
+    flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        super().flush()
+
+
+def test_process_stream_fsdb(rows):
+    import ip2asn
+    from ip2asn.main import process_stream
+
+    i2a = ip2asn.IP2ASN(io.StringIO(rows))
+    inh = io.StringIO("1.1.1.1\n\n1.1.1.2\n9.9.9.9\n")
+    outh = FlushCounter()
+
+    process_stream(i2a, inh, outh, output_fsdb=True, batch_size=2)
+
+    lines = [line for line in outh.getvalue().split("\n") if not line.startswith("#")]
+    assert lines[0].split("\t")[:3] == ["1.1.1.1", "16843009", "7497"]
+    assert lines[1].split("\t")[:3] == ["1.1.1.2", "16843010", "13335"]
+    assert lines[2].split("\t") == ["9.9.9.9", "-", "-", "-", "-", "-"]
+    assert outh.flushes == 2
+
+
+def test_process_stream_asn(rows):
+    import ip2asn
+    from ip2asn.main import process_stream
+
+    i2a = ip2asn.IP2ASN(io.StringIO(rows))
+    outh = FlushCounter()
+
+    process_stream(i2a, io.StringIO("13335\n65000\n"), outh, by_asn=True, asn_limit=2)
+
+    assert outh.getvalue().count("ASN: 13335") == 2
+    assert "ERROR: ASN '65000' was not found" in outh.getvalue()
+    assert outh.flushes == 1
+
+
+def test_process_stream_country(rows):
+    import ip2asn
+    from ip2asn.main import process_stream
+
+    i2a = ip2asn.IP2ASN(io.StringIO(rows))
+    inh = io.StringIO("cn\nZZ\n")
+
+    outh = FlushCounter()
+    process_stream(i2a, inh, outh, output_fsdb=True, by_country=True)
+    lines = [line for line in outh.getvalue().split("\n") if not line.startswith("#")]
+    assert [line.split("\t")[0] for line in lines[:3]] == ["7497", "4134", "ZZ"]
+    assert lines[2].split("\t") == ["ZZ", "-", "-", "-"]
+
+    inh.seek(0)
+    outh = FlushCounter()
+    process_stream(i2a, inh, outh, by_country=True, asn_limit=1)
+    assert outh.getvalue().count("ASN: ") == 1
+    assert "ERROR: country 'ZZ' has no ranges" in outh.getvalue()
+
+
+def test_process_stream_bad_lines(rows):
+    import ip2asn
+    from ip2asn.main import process_stream
+
+    i2a = ip2asn.IP2ASN(io.StringIO(rows))
+    inh = io.StringIO("1.0.0.1\nhostname.example\n1.1.1.1\n")
+
+    outh = FlushCounter()
+    process_stream(i2a, inh, outh, output_fsdb=True)
+    lines = [line for line in outh.getvalue().split("\n") if not line.startswith("#")]
+    assert lines[0].split("\t")[:3] == ["1.0.0.1", "16777217", "13335"]
+    assert lines[1].split("\t") == ["hostname.example", "-", "-", "-", "-", "-"]
+    assert lines[2].split("\t")[:3] == ["1.1.1.1", "16843009", "7497"]
+
+    inh.seek(0)
+    outh = FlushCounter()
+    process_stream(i2a, inh, outh)
+    assert "'hostname.example' was not found" in outh.getvalue()
+    assert "Address: 1.1.1.1" in outh.getvalue()
+
+
+def test_read_batches_from_a_pipe():
+    import os
+    from ip2asn.main import read_batches
+
+    (read_fd, write_fd) = os.pipe()
+    with os.fdopen(read_fd) as inh:
+        batches = read_batches(inh, batch_size=2)
+
+        # only the lines that have arrived are batched together
+        os.write(write_fd, b"1.1.1.1\n\n1.1.1.2\n1.1.1.3\n1.1.")
+        assert next(batches) == ["1.1.1.1", "1.1.1.2"]
+        assert next(batches) == ["1.1.1.3"]
+
+        os.write(write_fd, b"1.4\n")
+        assert next(batches) == ["1.1.1.4"]
+
+        os.write(write_fd, b"1.1.1.5")
+        os.close(write_fd)
+        assert list(batches) == [["1.1.1.5"]]
@@ -0,0 +1,64 @@
+import threading
+
+ADDRESSES = ["1.0.0.1", "1.0.4.4", "1.0.200.1", "1.1.1.1", "1.1.1.2", "9.9.9.9"]
+
+
+def test_lookup_many(i2a):
+    results = i2a.lookup_many(ADDRESSES)
+    assert results == [i2a.lookup_address(address) for address in ADDRESSES]
+    assert results[3]["ASN"] == "7497"
+    assert results[-1] is None
+
+
+def test_lookup_many_threaded(i2a):
+    addresses = ADDRESSES * 1000
+    expected = i2a.lookup_many(addresses)
+
+    results = i2a.lookup_many_threaded(addresses, max_workers=4, chunk_size=100)
+    assert results == expected
+
+
+def test_concurrent_lookups_during_reload(i2a):
+    expected = i2a.lookup_many(ADDRESSES)
+
+    failures = []
+    done = threading.Event()
+
+    def looker():
+        while not done.is_set():
+            results = i2a.lookup_many(ADDRESSES)
+            if results != expected:
+                failures.append(results)
+                return
+
+    def reloader():
+        for _ in range(50):
+            i2a.read_data()
+        done.set()
+
+    threads = [threading.Thread(target=looker) for _ in range(8)]
+    threads.append(threading.Thread(target=reloader))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+
+
+def test_lookup_many_threaded_uses_one_snapshot(i2a):
+    import io
+    import ip2asn
+
+    expected = i2a.lookup_many(ADDRESSES)
+    replacement = ip2asn.IP2ASN(io.StringIO("0\t4294967295\t64512\tZZ\tREPLACED\n"))
+    lookup_address = i2a._lookup_address
+
+    def reloading_lookup(address, backend):
+        # a reload finishing part way through the batch
+        i2a._backend = replacement._backend
+        return lookup_address(address, backend)
+
+    i2a._lookup_address = reloading_lookup
+    results = i2a.lookup_many_threaded(ADDRESSES * 10, max_workers=4, chunk_size=6)
+    assert results == expected * 10